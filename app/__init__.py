@@ -17,6 +17,9 @@ from flask_pymongo import PyMongo
 from flask_login import LoginManager
 from flask_mail import Mail
 import os
+from .core.instrumentation import CommandTally, init_instrumentation
+from .core.assets import init_assets
+from .core.compression import init_compression
 
 if os.path.exists("env.py"):
     import env
@@ -43,11 +46,98 @@ def create_app():
     app.config['MAIL_DEFAULT_SENDER'] = os.getenv(
         'MAIL_DEFAULT_SENDER', 'noreply@example.com')
 
+    # Mail Outbox Configuration
+    app.config['MAIL_OUTBOX_WORKER'] = os.getenv(
+        'MAIL_OUTBOX_WORKER', 'true').lower() in ['true', '1', 't']
+    app.config['MAIL_OUTBOX_POLL_INTERVAL'] = float(
+        os.getenv('MAIL_OUTBOX_POLL_INTERVAL', 30))
+    app.config['MAIL_OUTBOX_MAX_ATTEMPTS'] = int(
+        os.getenv('MAIL_OUTBOX_MAX_ATTEMPTS', 5))
+    app.config['MAIL_OUTBOX_RETRY_DELAY'] = float(
+        os.getenv('MAIL_OUTBOX_RETRY_DELAY', 30))
+    app.config['MAIL_OUTBOX_CLAIM_TIMEOUT'] = float(
+        os.getenv('MAIL_OUTBOX_CLAIM_TIMEOUT', 300))
+
+    # Background Job Configuration
+    app.config['JOBS_WORKER'] = os.getenv(
+        'JOBS_WORKER', 'true').lower() in ['true', '1', 't']
+    app.config['JOBS_POLL_INTERVAL'] = float(
+        os.getenv('JOBS_POLL_INTERVAL', 30))
+    app.config['JOBS_BATCH_SIZE'] = int(os.getenv('JOBS_BATCH_SIZE', 500))
+    app.config['JOBS_MAX_ATTEMPTS'] = int(os.getenv('JOBS_MAX_ATTEMPTS', 5))
+    app.config['JOBS_RETRY_DELAY'] = float(os.getenv('JOBS_RETRY_DELAY', 30))
+    app.config['JOBS_CLAIM_TIMEOUT'] = float(
+        os.getenv('JOBS_CLAIM_TIMEOUT', 300))
+    app.config['TOMBSTONE_CACHE_TTL'] = float(
+        os.getenv('TOMBSTONE_CACHE_TTL', 5))
+
+    # Pagination Configuration
+    app.config['POSTS_PAGE_SIZE'] = int(os.getenv('POSTS_PAGE_SIZE', 20))
+    app.config['USERS_PAGE_SIZE'] = int(os.getenv('USERS_PAGE_SIZE', 50))
+    app.config['COMMENTS_PAGE_SIZE'] = int(
+        os.getenv('COMMENTS_PAGE_SIZE', 50))
+
+    # Lookup Cache Configuration
+    app.config['CORE_CACHE_TTL'] = float(os.getenv('CORE_CACHE_TTL', 3600))
+    app.config['CORE_CACHE_CHECK_INTERVAL'] = float(
+        os.getenv('CORE_CACHE_CHECK_INTERVAL', 30))
+
+    # Page Cache Configuration
+    # Full pages served to anonymous visitors are cached for PAGE_CACHE_TTL
+    # seconds, then served stale for up to PAGE_CACHE_STALE more while they
+    # are rendered again. A PAGE_CACHE_TTL of 0 disables the cache.
+    app.config['PAGE_CACHE_TTL'] = float(os.getenv('PAGE_CACHE_TTL', 30))
+    app.config['PAGE_CACHE_STALE'] = float(os.getenv('PAGE_CACHE_STALE', 60))
+    app.config['PAGE_CACHE_SIZE'] = int(os.getenv('PAGE_CACHE_SIZE', 256))
+    app.config['PAGE_CACHE_CHECK_INTERVAL'] = float(
+        os.getenv('PAGE_CACHE_CHECK_INTERVAL', 5))
+
+    # Static Asset Configuration
+    # Serve the fingerprinted copies written by 'flask assets build'.
+    app.config['STATIC_FINGERPRINTS'] = os.getenv(
+        'STATIC_FINGERPRINTS', 'true').lower() in ['true', '1', 't']
+
+    # Response Compression Configuration
+    # gzip level (1-9, 0 disables) and smallest body worth compressing.
+    app.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', 6))
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 500))
+
+    # User Cache Configuration
+    app.config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', 60))
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 1024))
+
+    # Query Instrumentation Configuration
+    # QUERY_BUDGETS maps an endpoint (e.g. 'comments.edit_comment') to the
+    # maximum number of MongoDB commands one request to it may issue.
+    # QUERY_BUDGET_STRICT raises instead of warning; None means "when
+    # testing".
+    app.config['QUERY_BUDGETS'] = {}
+    app.config['QUERY_BUDGET_STRICT'] = None
+    # PAGE_WEIGHT_BUDGETS maps an endpoint to the maximum uncompressed size
+    # in bytes of its page, checked by 'flask bench' over a seeded dataset
+    # at the default page sizes.
+    app.config['PAGE_WEIGHT_BUDGETS'] = {
+        'posts.get_posts': 40000,
+        'comments.view_comments': 80000,
+        'auth.view_users': 200000,
+    }
+
+    # Index Configuration
+    app.config['MONGO_ENSURE_INDEXES'] = os.getenv(
+        'MONGO_ENSURE_INDEXES', 'true').lower() in ['true', '1', 't']
+
     # Initializing Extensions
-    mongo.init_app(app)
+    mongo.init_app(app, event_listeners=[CommandTally()])
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     mail.init_app(app)
+    # Registered first so it runs after every other after_request hook.
+    init_compression(app)
+    init_instrumentation(app)
+    init_assets(app)
+
+    from .core.filters import time_ago
+    app.add_template_filter(time_ago)
 
     from .core.views import core_bp
     from .auth.views import auth_bp
@@ -63,4 +153,36 @@ def create_app():
     app.register_blueprint(groups_bp)
     app.register_blueprint(errors_bp)
 
+    from .auth.models import user_cache
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+    user_cache.maxsize = app.config['USER_CACHE_SIZE']
+
+    from .core.page_cache import page_cache
+    page_cache.maxsize = app.config['PAGE_CACHE_SIZE']
+
+    from .core.commands import db_cli, outbox_cli, jobs_cli, assets_cli, \
+        seed_command, bench_command, recount_comments_command
+    app.cli.add_command(db_cli)
+    app.cli.add_command(outbox_cli)
+    app.cli.add_command(jobs_cli)
+    app.cli.add_command(assets_cli)
+    app.cli.add_command(seed_command)
+    app.cli.add_command(bench_command)
+    app.cli.add_command(recount_comments_command)
+
+    # Resume queued emails and jobs left over by a previous process, and
+    # create any missing index, once the app serves its first request.
+    from .core.outbox import Outbox
+    from .core.jobs import Jobs
+    from .core.indexes import bootstrap_indexes
+    from .core.worker import start_on_first_request
+    starters = []
+    if app.config['MAIL_OUTBOX_WORKER']:
+        starters.append(Outbox.start_worker)
+    if app.config['JOBS_WORKER']:
+        starters.append(Jobs.start_worker)
+    if app.config['MONGO_ENSURE_INDEXES']:
+        starters.append(bootstrap_indexes)
+    start_on_first_request(app, *starters)
+
     return app
@@ -1,36 +1,61 @@
+from collections import Counter
+from datetime import datetime
+import pytz
+from flask import current_app
 from flask_login import UserMixin
+from pymongo import ASCENDING, IndexModel, UpdateOne
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import mongo, login_manager
+from app.core.cache import TTLCache
+from app.core.identity import MISSING, forget, recall, remember
+from app.core.jobs import Jobs
+from app.core.models import Core, DELETED, NOT_DELETED
+from app.groups.models import Group
 from app.posts.models import Post
-from app.comments.models import Comment
+
+
+# Users loaded for authentication are cached per process, keyed by username,
+# so the hot path of an authenticated request makes no database round trip.
+# Only the fields User needs are kept; entries are dropped whenever the
+# profile, password or account changes. Sized and timed by USER_CACHE_SIZE
+# and USER_CACHE_TTL in create_app.
+user_cache = TTLCache()
 
 
 # Docstrings written by GPT4o and edited by myself.
 @login_manager.user_loader
 def load_user(username):
     """
-    Loads a user from the database by username.
+    Loads a user from the cache or the database by username.
 
-    This function is used by Flask-Login to retrieve a user object from the
-    database based on the provided username. It is decorated with
-    @login_manager.user_loader to indicate that it is the user loader callback
-    function.
+    This function is used by Flask-Login to retrieve a user object based on
+    the provided username. It is decorated with @login_manager.user_loader to
+    indicate that it is the user loader callback function. The username and
+    role are served from the user cache when possible; otherwise only those
+    fields are read from the database and cached. The returned user carries
+    no password hash, which is only loaded when logging in. Deleted users
+    waiting to be purged are treated as not found.
 
     Args:
         username (str): The username of the user to be loaded.
 
     Returns:
-        User: A User object if the user is found in the database.
+        User: A User object if the user is found.
         None: If the user is not found or an exception occurs during the
         database query.
     """
     try:
-        user_doc = mongo.db.users.find_one({"username": username})
-        if user_doc:
-            return User(
-                username=user_doc["username"],
-                password=user_doc["password"],
-                role=user_doc["role"])
+        cached = user_cache.get(username)
+        if cached is None:
+            user_doc = mongo.db.users.find_one(
+                {"username": username, **NOT_DELETED},
+                {"_id": 0, "username": 1, "role": 1}
+                )
+            if not user_doc:
+                return None
+            cached = (user_doc["username"], user_doc["role"])
+            user_cache.set(username, cached)
+        return User(username=cached[0], password=None, role=cached[1])
 
     except Exception as e:
         print(f"Error in load_user method: {e}")
@@ -38,6 +63,33 @@ def load_user(username):
 
 
 class User(UserMixin):
+    # Usernames and email addresses identify an account, so both are unique.
+    # The compound indexes back the filtered, username ordered pages of
+    # get_users. The sparse 'deleted_at' index only holds tombstoned users.
+    # Applied by app.core.indexes.
+    INDEXES = [
+        IndexModel(
+            [("username", ASCENDING)], name="username_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        IndexModel(
+            [("level", ASCENDING), ("username", ASCENDING)],
+            name="level_username"),
+        IndexModel(
+            [("provider", ASCENDING), ("username", ASCENDING)],
+            name="provider_username"),
+        IndexModel(
+            [("location_lower", ASCENDING), ("username", ASCENDING)],
+            name="location_lower_username"),
+        IndexModel(
+            [("deleted_at", ASCENDING)], name="deleted_at", sparse=True),
+    ]
+
+    # The fields shown on the Users page.
+    DISPLAY_FIELDS = {
+        "username": 1, "email": 1, "role": 1, "level": 1, "provider": 1,
+        "location": 1, "bio": 1
+    }
+
     def __init__(self, username, password, role):
         """
         Initializes a User instance.
@@ -78,6 +130,8 @@ class User(UserMixin):
                 {"username": self.username},
                 {"$set": {"password": new_password_hash}}
             )
+            user_cache.pop(self.username)
+            forget("users", self.username)
 
         except Exception as e:
             print(f'Error in set_password method: {e}')
@@ -125,7 +179,8 @@ class User(UserMixin):
         Retrieves a user from the database by username.
 
         This method queries the database for a user document with the specified
-        username. If a user is found, it returns an instance of the User class
+        username, unless the user was already loaded during the current
+        request. If a user is found, it returns an instance of the User class
         or a dictionary representation of the user depending on the value of
         the as_dict parameter. If no user is found or an exception occurs, it
         returns None.
@@ -148,7 +203,11 @@ class User(UserMixin):
             None.
         """
         try:
-            user = mongo.db.users.find_one({"username": username.lower()})
+            username = username.lower()
+            user = recall("users", username)
+            if user is MISSING:
+                user = remember("users", username, mongo.db.users.find_one(
+                    {"username": username}))
             if user:
                 if as_dict:
                     return user
@@ -196,10 +255,13 @@ class User(UserMixin):
             "level": "",
             "provider": "",
             "location": "",
+            "location_lower": "",
             "bio": ""
         }
         try:
             mongo.db.users.insert_one(registrant)
+            forget("users", username.lower())
+            Core.bump_version("users")
             return User(
                 username=username.lower(),
                 password=password,
@@ -243,10 +305,10 @@ class User(UserMixin):
         Updates a user's profile in the database.
 
         This static method updates the profile information of a user in the
-        database. It retrieves the existing user by username, retains the
-        current password, and updates the profile fields with the provided
-        values. If the role is not specified, it retains the current role of
-        the user.
+        database with a single partial update. Only the fields edited through
+        the profile form are set, so the password hash and username are never
+        rewritten and no prior read is needed. If the role is not specified,
+        the current role of the user is kept.
 
         Args:
             email (str): The new email address of the user.
@@ -264,39 +326,36 @@ class User(UserMixin):
             exception is caught and an error message is printed.
         """
         try:
-            user = User.find_by_username(username)
-            password = user.password
-            if role:
-                designated_role = role
-            else:
-                designated_role = user.role
             profile = {
                 "email": email,
-                "username": username,
-                "password": password,
-                "role": designated_role,
                 "level": level,
                 "provider": provider,
                 "location": location,
+                "location_lower": User.normalize(location),
                 "bio": bio
             }
+            if role:
+                profile["role"] = role
             mongo.db.users.update_one(
-                {"username": user.username},
+                {"username": username.lower()},
                 {"$set": profile}
                 )
+            user_cache.pop(username.lower())
+            forget("users", username.lower())
+            Core.bump_version("users")
         except Exception as e:
             print(f"Error in update_profile method: {e}")
 
     @staticmethod
     def delete_profile(username):
         """
-        Deletes a user's profile and associated data from the database.
+        Marks a user's profile as deleted and schedules its removal.
 
-        This static method deletes a user's profile from the database, along
-        with all answers and questions associated with the user. It first
-        deletes the user's answers, updates the answer count of the related
-        questions, then deletes the user's questions and all associated
-        answers, and finally deletes the user's profile.
+        The user is tombstoned with a 'deleted_at' field, which logs them out
+        and hides their posts, comments and groups straight away, and a
+        'purge_user' job is queued to delete that data in the background (see
+        purge_profile). The request therefore takes the same time however
+        much the user wrote.
 
         Args:
             username (str): The username of the user whose profile is to be
@@ -307,72 +366,229 @@ class User(UserMixin):
             exception is caught and an error message is printed.
         """
         try:
-            comments_to_delete = list(mongo.db.comments
-                                      .find({"username": username}))
-            for comment in comments_to_delete:
-                comment_id = comment["_id"]
-                post_id = Comment.find_post_id(comment_id)
-                Post.decrease_comment_count(post_id)
-                Comment.delete_comment(comment_id)
-
-            posts_to_delete = list(mongo.db.posts.find({"username": username}))
-            for post in posts_to_delete:
-                post_id = post["_id"]
-                mongo.db.comments.delete_many({"post_id": post_id})
-                mongo.db.posts.delete_one({"_id": post_id})
-
-            mongo.db.groups.delete_many({"tutor": username})
-
-            mongo.db.users.delete_one({"username": username})
+            mongo.db.users.update_one(
+                {"username": username},
+                {"$set": {"deleted_at": datetime.now(pytz.utc)}}
+                )
+            user_cache.pop(username)
+            forget("users", username)
+            Core.invalidate_tombstones()
+            Core.bump_version("users", "posts", "comments", "groups")
+            Jobs.enqueue("purge_user", {"username": username})
         except Exception as e:
             print(f"Error in delete_profile method: {e}")
 
     @staticmethod
-    def get_users(level, provider, username, email, location):
+    def purge_profile(username, batch_size):
+        """
+        Removes one batch of a deleted user's data. Run by the job runner
+        until it returns True.
+
+        Each call does one of the following, in order, using set operations
+        so its cost is bounded by 'batch_size':
+          1. Removes the user from the students of every group.
+          2. Deletes up to 'batch_size' of the user's comments, lowering the
+          comment counts of the posts they were on with one bulk write.
+          3. Deletes up to 'batch_size' of the user's posts with their
+          comments.
+          4. Deletes the groups the user tutors (through Group.delete_group,
+          which queues their own purge) and finally the profile.
+        Steps 2 and 3 repeat until nothing is left. On a replica set, each
+        batch runs in a transaction.
+
+        Args:
+            username (str): The username of the deleted user.
+            batch_size (int): The maximum number of comments or posts deleted
+            per call.
+
+        Returns:
+            bool: True once the profile has been removed, False if more
+            batches remain.
         """
-        Retrieves a list of users from the database based on the provided
+        if mongo.db.groups.update_many(
+                {"students": username}, {"$pull": {"students": username}}
+                ).modified_count:
+            Core.bump_version("groups")
+
+        def delete_comments(session):
+            comments = list(mongo.db.comments.find(
+                {"username": username}, {"post_id": 1}, session=session
+                ).limit(batch_size))
+            counts = Counter(comment["post_id"] for comment in comments)
+            if counts:
+                mongo.db.posts.bulk_write([
+                    UpdateOne(
+                        {"_id": post_id}, {"$inc": {"comment_count": -count}})
+                    for post_id, count in counts.items()
+                ], ordered=False, session=session)
+                mongo.db.comments.delete_many(
+                    {"_id": {"$in": [c["_id"] for c in comments]}},
+                    session=session)
+                Core.bump_version("posts", "comments")
+            return len(comments)
+
+        if Core.run_in_transaction(delete_comments):
+            return False
+        if Core.run_in_transaction(lambda session: Post.delete_batch(
+                {"username": username}, batch_size, session)):
+            return False
+
+        for group in mongo.db.groups.find(
+                {"tutor": username, **NOT_DELETED}, {"_id": 1}):
+            Group.delete_group(group["_id"])
+        mongo.db.users.delete_one({"username": username, **DELETED})
+        Core.invalidate_tombstones()
+        Core.bump_version("users")
+        return True
+
+    @staticmethod
+    def get_users(level, provider, username, email, location, after=None,
+                  page_size=None):
+        """
+        Retrieves a page of users from the database based on the provided
         filters.
 
         This static method queries the database for user documents that match
         the provided filter criteria. It constructs a query based on the
-        non-None parameters and returns the list of users that match the query.
-        If no filters are provided, it returns all users.
+        non-empty parameters and returns one page of the users that match,
+        ordered by username. If no filters are provided, it pages through all
+        users.
+
+        Deleted users waiting to be purged are left out. Level, provider and
+        email must match exactly. Username and location
+        match case-insensitively on their beginning, using a range on the
+        lowercase 'username' and 'location_lower' fields so the lookups are
+        served by indexes. Only the fields displayed on the Users page are
+        returned, so password hashes never leave the database.
 
         Args:
             level (str): The level of the users to be retrieved.
             provider (str): The provider of the users to be retrieved.
-            username (str): The username of the users to be retrieved.
+            username (str): The start of the usernames to be retrieved.
             email (str): The email address of the user to be retrieved.
-            location (str): The location of the users to be retrieved.
+            location (str): The start of the locations of the users to be
+            retrieved.
+            after (str, optional): The last username of the previous page.
+            Only users whose username sorts after it are returned.
+            page_size (int, optional): The maximum number of users to return.
+            Defaults to the USERS_PAGE_SIZE config value.
 
         Returns:
             tuple: A tuple containing:
                 - list: A list of user documents that match the query.
-                - dict: The query dictionary used to filter the users. This is
-                used to populate the html filter inputs.
+                - dict: The filters that were applied. This is used to
+                populate the html filter inputs.
+                - str: The username to pass as 'after' to fetch the next page,
+                or None if this is the last page.
+            If an exception occurs, returns an empty list, the filters and
+            None.
 
         Raises:
             Exception: If there is an issue with the database query, the
-            exception is caught and an error message is printed, returning
-            None.
+            exception is caught and an error message is printed.
         """
-        query = {}
+        filters = {}
+        query = dict(NOT_DELETED)
         if level:
-            query['level'] = level
+            filters['level'] = query['level'] = level
         if provider:
-            query['provider'] = provider
-        if username:
-            query['username'] = username
+            filters['provider'] = query['provider'] = provider
         if email:
-            query['email'] = email
+            filters['email'] = query['email'] = email
+        if username:
+            filters['username'] = username
+            query['username'] = User.prefix_range(username)
         if location:
-            query['location'] = location
+            filters['location'] = location
+            query['location_lower'] = User.prefix_range(location)
+        if after:
+            query.setdefault('username', {})['$gt'] = after.lower()
+        if page_size is None:
+            page_size = current_app.config['USERS_PAGE_SIZE']
         try:
-            if query:
-                users = list(mongo.db.users.find(query))
-            else:
-                users = list(mongo.db.users.find())
-            return users, query
+            # One extra user is fetched to find out if another page exists.
+            users = list(
+                mongo.db.users.find(query, User.DISPLAY_FIELDS)
+                .sort("username", 1)
+                .limit(page_size + 1)
+                )
+            next_after = None
+            if len(users) > page_size:
+                users = users[:page_size]
+                next_after = users[-1]['username']
+            return users, filters, next_after
         except Exception as e:
             print(f"Error in get_users method: {e}")
-            return None
+            return [], filters, None
+
+    @staticmethod
+    def prefix_range(prefix):
+        """
+        Builds a query matching lowercase strings that start with a prefix.
+
+        Unlike an unanchored or case-insensitive regex, a range can use the
+        bounds of an index on the field.
+
+        Args:
+            prefix (str): The prefix, in any case.
+
+        Returns:
+            dict: A range condition for use in a query.
+        """
+        prefix = prefix.strip().lower()
+        return {"$gte": prefix, "$lt": prefix + "\uffff"}
+
+    @staticmethod
+    def normalize_locations(batch_size=1000):
+        """
+        Fills in the 'location_lower' field for users created before it
+        existed.
+
+        Users are processed in batches with one bulk write per batch, so the
+        whole collection is never loaded into memory.
+
+        Args:
+            batch_size (int): The number of users updated per bulk write.
+
+        Returns:
+            int: The number of users updated.
+
+        Raises:
+            Exception: If there is an issue with the database operations, the
+            exception is caught and an error message is printed.
+        """
+        updated = 0
+        try:
+            cursor = mongo.db.users.find(
+                {"location_lower": {"$exists": False}}, {"location": 1}
+                ).batch_size(batch_size)
+            batch = []
+            for user in cursor:
+                batch.append(UpdateOne(
+                    {"_id": user["_id"]},
+                    {"$set": {"location_lower": User.normalize(
+                        user.get("location"))}}
+                    ))
+                if len(batch) == batch_size:
+                    updated += mongo.db.users.bulk_write(
+                        batch, ordered=False).modified_count
+                    batch = []
+            if batch:
+                updated += mongo.db.users.bulk_write(
+                    batch, ordered=False).modified_count
+        except Exception as e:
+            print(f"Error in normalize_locations method: {e}")
+        return updated
+
+    @staticmethod
+    def normalize(value):
+        """
+        Returns the form of a string used for case-insensitive lookups.
+
+        Args:
+            value (str): The string to normalize. None is treated as empty.
+
+        Returns:
+            str: The stripped, lowercase string.
+        """
+        return (value or "").strip().lower()
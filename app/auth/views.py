@@ -2,10 +2,10 @@ from functools import wraps
 from flask import Blueprint, render_template, request, redirect, url_for, \
     flash, current_app
 from flask_login import login_user, logout_user, current_user, login_required
-from flask_mail import Message
 from itsdangerous import URLSafeTimedSerializer, SignatureExpired, BadSignature
-from app import mail
+from app.core.conditional import conditional
 from app.core.models import Core
+from app.core.outbox import Outbox
 from app.auth.models import User
 from app.posts.models import Post
 from app.groups.models import Group
@@ -24,9 +24,10 @@ def send_confirmation(email):
       1. Generates a secure token using the email address and the application's
       secret key.
       2. Constructs a URL for password reset using the token.
-      3. Sends an email with a password reset link to the specified email
-      address.
-      4. Flashes a success message to the user.
+      3. Queues an email with a password reset link to the specified email
+      address in the outbox, to be sent in the background.
+      4. Flashes a success message to the user, or an error message if the
+      email could not be queued.
     If no email is provided, it flashes an error message.
     After the actions, it redirects the user either to the login page (on
     success) or to the home page (if email is not provided).
@@ -43,13 +44,16 @@ def send_confirmation(email):
         s = URLSafeTimedSerializer(current_app.config['SECRET_KEY'])
         token = s.dumps(email, salt='reset-password-salt')
         reset_url = url_for('auth.reset_password', token=token, _external=True)
-        msg = Message("Password Reset Request", recipients=[email])
-        msg.body = (
-            f"To reset your password, please visit the following link: "
-            f"{reset_url}"
-        )
-        mail.send(msg)
-        flash('A confirmation email has been sent.', 'success')
+        if Outbox.enqueue(
+                "Password Reset Request",
+                [email],
+                f"To reset your password, please visit the following link: "
+                f"{reset_url}"
+                ):
+            flash('A confirmation email has been sent.', 'success')
+        else:
+            flash('The email could not be sent. Please try again later.',
+                  'error')
         return redirect(url_for('auth.login'))
     else:
         flash("Email Not Specified")
@@ -151,10 +155,10 @@ def reg_confirmation():
       a registration confirmation link.
       - POST: Takes the provided email from the form, checks if it's already
       registered, generates a secure token using the application's secret key,
-      constructs a URL for registration confirmation with the token, and sends
-      an email to the user with this link. Upon successfully sending the email,
-      it flashes a success message and redirects the user back to the
-      confirmation page.
+      constructs a URL for registration confirmation with the token, and queues
+      an email to the user with this link in the outbox. Once the email is
+      queued, it flashes a success message (or an error message if it could
+      not be queued) and redirects the user back to the confirmation page.
 
     Returns:
         Response:
@@ -175,13 +179,16 @@ def reg_confirmation():
         confirmation_url = url_for(
             'auth.register', token=token, _external=True
             )
-        msg = Message("Confirm email address to register", recipients=[email])
-        msg.body = (
-            f"To confirm email, please visit the following link: "
-            f"{confirmation_url}"
-            )
-        mail.send(msg)
-        flash('A confirmation email has been sent.', 'success')
+        if Outbox.enqueue(
+                "Confirm email address to register",
+                [email],
+                f"To confirm email, please visit the following link: "
+                f"{confirmation_url}"
+                ):
+            flash('A confirmation email has been sent.', 'success')
+        else:
+            flash('The email could not be sent. Please try again later.',
+                  'error')
         return redirect(url_for('auth.reg_confirmation'))
 
     return render_template('reg_email.html')
@@ -325,6 +332,7 @@ def logout():
 @auth_bp.route("/profile", defaults={"username": None})
 @auth_bp.route("/profile/<username>")
 @login_required
+@conditional("users", "posts")
 def profile(username):
     """
     Displays the profile page for a specified or currently authenticated user.
@@ -334,7 +342,8 @@ def profile(username):
     provided, or if the specified username does not match any existing user,
     the function defaults to the profile of the currently authenticated user.
     In the case of an incorrect or missing username, a flash message is
-    displayed and the user is redirected to their own profile.
+    displayed and the user is redirected to their own profile. Repeat visits
+    are answered with 304 Not Modified until a user or post changes.
 
     Args:
         username (str, optional): The username of the user whose profile is to
@@ -518,17 +527,20 @@ def delete_profile(username):
             )
 
 
-@auth_bp.route("/view_users", methods=["GET", "POST"])
+@auth_bp.route("/view_users")
 @login_required
 def view_users():
     """
     Displays and filters the list of users.
 
-    On a GET request, it retrieves all users and renders the users view
-    template.
-    On a POST request, it filters the users based on the provided form data
-    (level, provider, username, email, location) and then renders the users
-    view template with the filtered results.
+    The filters (level, provider, username, email, location) are read once
+    from the query string, so filtered views can be bookmarked and each
+    request runs a single users query. Username and location match on their
+    beginning, ignoring case. Users are shown a page at a time in username
+    order; the 'after' parameter, set by the "Load more" link, selects the
+    next page.
+    Group membership is mapped once per request so the template can offer
+    each user only the groups they are not yet in.
 
     Returns:
         Response: Renders the users view template with the list of users and
@@ -540,19 +552,17 @@ def view_users():
             url_for("auth.profile", username=current_user.username)
             )
 
-    users, query = User.get_users(None, None, None, None, None)
-
-    if request.method == 'POST':
-        level = request.form.get('level')
-        provider = request.form.get('provider')
-        username = request.form.get('username')
-        email = request.form.get('email')
-        location = request.form.get('location')
-        users, query = User.get_users(
-            level, provider, username, email, location
-            )
+    users, query, next_after = User.get_users(
+        request.args.get('level'),
+        request.args.get('provider'),
+        request.args.get('username'),
+        request.args.get('email'),
+        request.args.get('location'),
+        request.args.get('after')
+        )
 
     groups = Group.get_groups_by_role(current_user.role, current_user.username)
+    memberships = Group.get_membership_map(groups)
     levels = Core.get_levels()
     providers = Core.get_providers()
 
@@ -561,5 +571,7 @@ def view_users():
         users=users,
         query=query,
         groups=groups,
+        memberships=memberships,
+        next_after=next_after,
         levels=levels,
         providers=providers)
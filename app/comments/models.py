@@ -1,11 +1,21 @@
-from datetime import datetime
-import humanize
-import pytz
 from bson.objectid import ObjectId
+from flask import current_app
+from pymongo import ASCENDING, IndexModel
 from app import mongo
+from app.core.identity import MISSING, forget, recall, remember
+from app.core.models import Core
 
 
 class Comment:
+    # Indexes backing comment threads and the purge in
+    # User.purge_profile. Applied by app.core.indexes.
+    INDEXES = [
+        IndexModel(
+            [("post_id", ASCENDING), ("_id", ASCENDING)],
+            name="post_id_id"),
+        IndexModel([("username", ASCENDING)], name="username"),
+    ]
+
     # Docstrings written by GPT4o and edited by myself.
     @staticmethod
     def find_by_id(comment_id):
@@ -13,7 +23,8 @@ class Comment:
         Retrieves a comment from the database by its ID.
 
         This method queries the database to find a comment document that
-        matches the provided comment ID.
+        matches the provided comment ID, unless the comment was already loaded
+        during the current request.
 
         Args:
             comment_id (str): The ID of the comment to be retrieved.
@@ -27,116 +38,147 @@ class Comment:
             exception is caught and an error message is printed, returning
             None.
         """
+        comment = recall("comments", comment_id)
+        if comment is not MISSING:
+            return comment
         try:
             comment = mongo.db.comments.find_one({"_id": ObjectId(comment_id)})
-            return comment
+            return remember("comments", comment_id, comment)
         except Exception as e:
             print(f"Error in find_by_id method: {e}")
             return None
 
     @staticmethod
-    def find_comments_by_post_id(post_id):
+    def find_comments_by_post_id(post_id, order="oldest", after=None,
+                                 page_size=None):
         """
-        Retrieves comments from the database associated with the given post ID
-        and adds a time_ago property to each comment.
+        Retrieves a page of the comments associated with the given post ID.
 
-        This method queries the database for all comments associated with the
-        specified post ID. For each comment retrieved, it adds a time_ago
-        property to indicate how long ago the comment was posted. This helps
-        provide context about the recency of comments when displaying them to
-        users.
+        This method queries the database for the comments on the specified
+        post, oldest or newest first, one page at a time using keyset
+        pagination: passing the ID of the last comment of a page as 'after'
+        returns the next page. Each page is a bounded range scan on the
+        (post_id, _id) index, so long threads cost the same per page as short
+        ones. Comments by deleted users are hidden until their purge job
+        removes them.
 
         Args:
             post_id (str): The ID of the post whose comments are to be
             retrieved.
+            order (str, optional): 'oldest' (the default) or 'newest' first.
+            after (str, optional): The ID of the last comment on the previous
+            page. Invalid IDs are ignored.
+            page_size (int, optional): The maximum number of comments to
+            return. Defaults to the COMMENTS_PAGE_SIZE config value.
 
         Returns:
-            list: A list of comment documents, each with an added time_ago
-            property. If an exception occurs, an empty list is returned.
+            tuple:
+                - list: A list of comment documents.
+                - str: The ID to pass as 'after' to fetch the next page, or
+                None if this is the last page.
+                If an exception occurs, an empty list and None are returned.
 
         Raises:
             Exception: If there is an issue with the database query, the
             exception is caught, an error message is printed, and an empty list
             is returned.
         """
+        if page_size is None:
+            page_size = current_app.config['COMMENTS_PAGE_SIZE']
+        direction = -1 if order == "newest" else 1
         try:
+            query = Comment.thread_query(post_id)
+            if after and ObjectId.is_valid(after):
+                operator = "$lt" if direction == -1 else "$gt"
+                query["_id"] = {operator: ObjectId(after)}
+            # One extra comment is fetched to find out if another page exists.
             comments = list(
-                mongo.db.comments.find({"post_id": ObjectId(post_id)})
+                mongo.db.comments.find(query)
+                .sort("_id", direction)
+                .limit(page_size + 1)
                 )
-            for comment in comments:
-                Comment.set_time_ago(comment)
-            return comments
+            next_after = None
+            if len(comments) > page_size:
+                comments = comments[:page_size]
+                next_after = str(comments[-1]["_id"])
+            return comments, next_after
         except Exception as e:
             print(f"Error in find_comments_by_post_id method: {e}")
-            return []
+            return [], None
 
     @staticmethod
-    def set_time_ago(comment):
+    def find_comments_around(post_id, comment_id, size=None):
         """
-        Calculates and sets the 'time_ago' property for a comment based on its
-        creation time.
+        Retrieves the comments surrounding one comment of a thread, oldest
+        first.
 
-        This method extracts the creation time of the comment from its MongoDB
-        ObjectId, calculates the time elapsed since its creation, and uses the
-        'humanize' library to generate a human-readable 'time_ago' description.
-        It then sets this 'time_ago' value as a property of the comment
-        document.
+        Up to half of 'size' comments posted before the target are returned,
+        followed by the target and the comments after it. This takes two
+        range scans on the (post_id, _id) index whatever the thread's length.
 
         Args:
-            comment (dict): The comment document to update with a 'time_ago'
-            property.
+            post_id (str): The ID of the post the comment belongs to.
+            comment_id (str): The ID of the comment to center the window on.
+            size (int, optional): The maximum number of comments to return.
+            Defaults to the COMMENTS_PAGE_SIZE config value.
+
+        Returns:
+            list: A list of comment documents. If an exception occurs, an empty
+            list is returned.
 
         Raises:
-            Exception: If there is an issue with calculating or setting the
-            'time_ago' property, the exception is caught and an error message
-            is printed. This ensures that the method gracefully handles errors
-            while processing dates.
+            Exception: If there is an issue with the database query, the
+            exception is caught and an error message is printed.
         """
+        if size is None:
+            size = current_app.config['COMMENTS_PAGE_SIZE']
         try:
-            creation_time = comment['_id'].generation_time.replace(
-                tzinfo=pytz.utc
+            earlier = Comment.thread_query(post_id)
+            earlier["_id"] = {"$lt": ObjectId(comment_id)}
+            before = list(
+                mongo.db.comments.find(earlier)
+                .sort("_id", -1)
+                .limit(size // 2)
                 )
-            comment['time_ago'] = humanize.naturaltime(
-                datetime.now(pytz.utc) - creation_time
+            later = Comment.thread_query(post_id)
+            later["_id"] = {"$gte": ObjectId(comment_id)}
+            after = list(
+                mongo.db.comments.find(later)
+                .sort("_id", 1)
+                .limit(max(size - len(before), 1))
                 )
+            return before[::-1] + after
         except Exception as e:
-            print(f"Error in set_time_ago method: {e}")
+            print(f"Error in find_comments_around method: {e}")
+            return []
 
     @staticmethod
-    def count_comments(comments):
+    def thread_query(post_id):
         """
-        Returns the number of comments in the provided list.
-
-        This method calculates the length of the provided list of comments and
-        returns it. If an exception occurs during the process, the method
-        catches the exception, prints an error message, and returns 0. This
-        ensures robust error handling during comment count operations.
+        Builds the query selecting the visible comments of a post, leaving out
+        comments by deleted users waiting to be purged.
 
         Args:
-            comments (list): A list of comment documents to count.
+            post_id (str): The ID of the post.
 
         Returns:
-            int: The number of comments in the provided list. Returns 0 if an
-            exception occurs.
-
-        Raises:
-            Exception: If there is an issue with counting the comments, the
-            exception is caught and an error message is printed.
+            dict: The query.
         """
-        try:
-            return len(comments)
-        except Exception as e:
-            print(f"Error in count_comments method: {e}")
-            return 0
+        query = {"post_id": ObjectId(post_id)}
+        usernames = Core.get_tombstones("users", "username")
+        if usernames:
+            query["username"] = {"$nin": usernames}
+        return query
 
     @staticmethod
     def find_post_id(comment_id):
         """
         Retrieves the ID of the post associated with a given comment.
 
-        This method queries the database to find the post ID associated with
-        the specified comment ID. If an exception occurs, it catches the
-        exception, prints an error message, and returns None.
+        This method looks the comment up with find_by_id, so no query is made
+        if the comment was already loaded during the current request. If an
+        exception occurs, it catches the exception, prints an error message,
+        and returns None.
 
         Args:
             comment_id (str): The ID of the comment for which the associated
@@ -153,8 +195,7 @@ class Comment:
             clear feedback for troubleshooting.
         """
         try:
-            query = {"_id": ObjectId(comment_id)}
-            comment_doc = mongo.db.comments.find_one(query)
+            comment_doc = Comment.find_by_id(comment_id)
             post_id = comment_doc["post_id"]
             return post_id
         except Exception as e:
@@ -164,12 +205,15 @@ class Comment:
     @staticmethod
     def insert_comment(post_id, text, username):
         """
-        Inserts a new comment into the comments collection in the database.
+        Inserts a new comment into the comments collection and increments the
+        comment_count of its post.
 
-        This method creates a comment document with the provided post ID,
-        comment text, and username, and inserts it into the comments collection
-        in the database. If an exception occurs during this process, it catches
-        the exception and prints an error message.
+        The post's counter is incremented first, which doubles as the check
+        that the post exists, and the comment is inserted only if it does. The
+        write therefore takes two round trips and the counter always changes
+        together with the comments: on a replica set both writes run in one
+        transaction, and elsewhere the increment is undone if the insert
+        fails.
 
         Args:
             post_id (str): The ID of the post to which the comment is
@@ -177,71 +221,147 @@ class Comment:
             text (str): The text content of the comment.
             username (str): The username of the user who provided the comment.
 
+        Returns:
+            bool: True if the comment was added, False if the post does not
+            exist or an exception occurs.
+
         Raises:
             Exception: If there is an issue with inserting the comment into the
             database, the exception is caught and an error message is printed.
         """
+        def write(session):
+            post = mongo.db.posts.update_one(
+                {"_id": ObjectId(post_id)},
+                {"$inc": {"comment_count": 1}},
+                session=session
+                )
+            if not post.matched_count:
+                return False
+            try:
+                mongo.db.comments.insert_one({
+                    "post_id": ObjectId(post_id),
+                    "text": text,
+                    "username": username
+                }, session=session)
+            except Exception:
+                if session is None:
+                    mongo.db.posts.update_one(
+                        {"_id": ObjectId(post_id)},
+                        {"$inc": {"comment_count": -1}}
+                        )
+                raise
+            return True
+
         try:
-            comment = {
-                "post_id": ObjectId(post_id),
-                "text": text,
-                "username": username
-            }
-            mongo.db.comments.insert_one(comment)
+            return Core.run_in_transaction(write)
         except Exception as e:
             print(f"Error in insert_comment method: {e}")
+            return False
+        finally:
+            forget("posts", post_id)
+            Core.bump_version("posts", "comments")
 
     @staticmethod
-    def edit_comment(comment_id, post_id, text, username):
+    def edit_comment(comment_id, text, username=None):
         """
-        Updates an existing comment in the database.
+        Updates the text of an existing comment in the database.
 
-        This method updates the content of an existing comment in the database
-        based on the provided comment ID. It sets the new post ID, text, and
-        username for the comment. If an exception occurs, it catches the
-        exception and prints an error message.
+        Only the text is changed, with a single find_one_and_update, so the
+        comment keeps its author and post even when edited by an Admin.
 
         Args:
             comment_id (str): The ID of the comment to be updated.
-            post_id (str): The ID of the post to which the comment is
-            associated.
             text (str): The updated text content of the comment.
-            username (str): The username of the user who provided the comment.
+            username (str, optional): If given, the comment is only updated if
+            it was written by this user.
+
+        Returns:
+            ObjectId: The ID of the comment's post, or None if no matching
+            comment was found or an exception occurs.
 
         Raises:
             Exception: If there is an issue with updating the comment in the
             database, the exception is caught and an error message is printed.
         """
         try:
-            comment = {
-                "post_id": post_id,
-                "text": text,
-                "username": username
-            }
-            mongo.db.comments.update_one(
-                {"_id": ObjectId(comment_id)},
-                {"$set": comment}
+            comment = mongo.db.comments.find_one_and_update(
+                Comment.ownership_filter(comment_id, username),
+                {"$set": {"text": text}},
+                projection={"post_id": 1}
                 )
+            forget("comments", comment_id)
+            Core.bump_version("comments")
+            return comment["post_id"] if comment else None
         except Exception as e:
             print(f"Error in edit_comment method: {e}")
+            return None
 
     @staticmethod
-    def delete_comment(comment_id):
+    def delete_comment(comment_id, username=None):
         """
-        Deletes a comment from the database.
+        Deletes a comment from the database and decrements the comment_count
+        of its post.
 
-        This method removes a comment from the database based on the provided
-        comment ID. If an exception occurs, it catches the exception and prints
-        an error message.
+        The comment is removed with find_one_and_delete, which returns its post
+        ID, and the post's counter is then decremented: two round trips in
+        total, run in a transaction on a replica set. Only the request that
+        actually deleted the comment decrements the counter, so concurrent
+        deletes of the same comment cannot make it drift.
 
         Args:
             comment_id (str): The ID of the comment to be deleted.
+            username (str, optional): If given, the comment is only deleted if
+            it was written by this user.
+
+        Returns:
+            ObjectId: The ID of the deleted comment's post, or None if no
+            matching comment was found or an exception occurs.
 
         Raises:
             Exception: If there is an issue with deleting the comment from the
             database, the exception is caught and an error message is printed.
         """
+        def write(session):
+            comment = mongo.db.comments.find_one_and_delete(
+                Comment.ownership_filter(comment_id, username),
+                projection={"post_id": 1},
+                session=session
+                )
+            if comment is None:
+                return None
+            mongo.db.posts.update_one(
+                {"_id": comment["post_id"]},
+                {"$inc": {"comment_count": -1}},
+                session=session
+                )
+            return comment["post_id"]
+
         try:
-            mongo.db.comments.delete_one({"_id": ObjectId(comment_id)})
+            post_id = Core.run_in_transaction(write)
+            forget("comments", comment_id)
+            forget("posts", post_id)
+            Core.bump_version("posts", "comments")
+            return post_id
         except Exception as e:
             print(f"Error in delete_comment method: {e}")
+            return None
+
+    @staticmethod
+    def ownership_filter(comment_id, username=None):
+        """
+        Builds the query selecting a comment, restricted to its author when a
+        username is given, so permission checks happen in the same round trip
+        as the write.
+
+        Args:
+            comment_id (str): The ID of the comment.
+            username (str, optional): The username the comment must belong to.
+            None (e.g. for an Admin) matches any author.
+
+        Returns:
+            dict: The query.
+        """
+        query = {"_id": ObjectId(comment_id)}
+        if username is not None:
+            query["username"] = username
+        return query
@@ -2,6 +2,7 @@ from functools import wraps
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from bson.objectid import ObjectId
+from app.core.conditional import conditional
 from app.comments.models import Comment
 from app.posts.models import Post
 
@@ -12,16 +13,20 @@ comments_bp = Blueprint('comments', __name__, template_folder='../templates')
 # Docstrings written by GPT4o and edited by myself.
 @comments_bp.route("/view_comments", defaults={"post_id": None})
 @comments_bp.route("/view_comments/<post_id>")
+@conditional("posts", "comments")
 def view_comments(post_id):
     """
     Renders the view_comments template for a specific post.
 
-    This function retrieves a post and its associated comments from the
-    database. It also sets the relative time since the post was created and
-    counts the number of comments. If the post exists, it renders the
-    view_comments template with the post, comments, and the total comment
-    count. If no post_id is provided or if the post does not exist, it
-    redirects to a general posts page with an appropriate error message.
+    This function retrieves a post and a page of its comments from the
+    database. The number of comments shown is the post's stored
+    comment_count. The query string selects the page:
+      - 'order' is 'oldest' (the default) or 'newest' first.
+      - 'after', set by the "Load more" link, selects the next page.
+    Repeat visits are answered with 304 Not Modified until a post or comment
+    changes.
+    If no post_id is provided or if the post does not exist, it redirects to
+    a general posts page with an appropriate error message.
 
     Args:
         post_id (str, optional): The ID of the post for which comments are to
@@ -29,8 +34,9 @@ def view_comments(post_id):
 
     Returns:
         Response:
-            - Renders the 'view_comments.html' template with the post, its
-            comments, and the count of comments if the post is found.
+            - Renders the 'view_comments.html' template with the post, a page
+            of its comments, the order and the cursor for the next page if
+            the post is found.
             - Redirects to the 'posts.get_posts' page with an error message if
             the post is not found or the post_id is not specified.
     """
@@ -39,15 +45,17 @@ def view_comments(post_id):
         if post is None:
             flash("Post Not Found")
             return redirect(url_for("posts.get_posts"))
-        Post.set_time_ago(post)
-        comments = Comment.find_comments_by_post_id(post_id)
-        comment_count = Comment.count_comments(comments)
+        order = "newest" if request.args.get("order") == "newest" else "oldest"
+        after = request.args.get("after")
+        comments, next_after = Comment.find_comments_by_post_id(
+            post_id, order, after)
 
         return render_template(
             "view_comments.html",
             post=post,
             comments=comments,
-            comment_count=comment_count
+            order=order,
+            next_after=next_after
             )
     else:
         flash("Post Not Specified")
@@ -61,11 +69,12 @@ def comment(post_id):
     """
     Manages the addition of comments to a specific post.
 
-    On POST requests, it retrieves the comment text from the form, saves the
-    new comment in the database associated with the post, and updates the
-    comment count for the post. A success message is then flashed to the user,
-    and they are redirected to the view_comments page to see their new comment
-    and all others.
+    On POST requests, it retrieves the comment text from the form and saves
+    the new comment in the database, incrementing the comment count of the
+    post in the same operation. A success message is then flashed to the
+    user, and they are redirected to the view_comments page to see their new
+    comment and all others. GET requests are redirected to the view_comments
+    page, which holds the comment form.
 
     Args:
         post_id (str, optional): The ID of the post to which the comment is to
@@ -80,19 +89,15 @@ def comment(post_id):
             post is found or the post_id is not specified.
     """
     if post_id:
-        found_post = Post.find_by_id(post_id)
-        if not found_post:
-            flash("No Post Found")
-            return redirect(url_for("posts.get_posts"))
-
         if request.method == "POST":
             text = request.form.get("text")
             username = current_user.username
-            Comment.insert_comment(post_id, text, username)
-            Post.increase_comment_count(post_id)
+            if not Comment.insert_comment(post_id, text, username):
+                flash("No Post Found")
+                return redirect(url_for("posts.get_posts"))
             flash("Comment added")
 
-            return redirect(url_for("comments.view_comments", post_id=post_id))
+        return redirect(url_for("comments.view_comments", post_id=post_id))
     else:
         flash("Post Not Specified")
         return redirect(url_for("posts.get_posts"))
@@ -147,8 +152,11 @@ def edit_comment(comment_id):
     Handles the editing of an existing comment and updates the database.
 
     On a GET request, it renders the edit_comment template with the current
-    comment details. On a POST request, it updates the comment in the database
-    with the provided text, flashes a success message to the user, and
+    comment details, surrounded by a window of the comments posted just
+    before and after it rather than the whole thread. The comment and its
+    post are served from the request's identity map when the permission
+    check has already loaded them. On a POST request, it updates the text of
+    the comment in the database, flashes a success message to the user, and
     redirects to the view_comments template to display the post with the
     updated list of comments.
 
@@ -162,18 +170,19 @@ def edit_comment(comment_id):
             - Redirects to the view_comments template to display the post with
             the updated comment on a POST request.
     """
-    post_id = Comment.find_post_id(comment_id)
-
     if request.method == "POST":
         text = request.form.get("text")
-        username = current_user.username
-        Comment.edit_comment(comment_id, post_id, text, username)
+        post_id = Comment.edit_comment(comment_id, text)
+        if post_id is None:
+            flash("Comment Not Found", "error")
+            return redirect(url_for("posts.get_posts"))
         flash("Comment Edited")
 
         return redirect(url_for("comments.view_comments", post_id=post_id))
 
+    post_id = Comment.find_post_id(comment_id)
     post = Post.find_by_id(post_id)
-    comments = Comment.find_comments_by_post_id(post_id)
+    comments = Comment.find_comments_around(post_id, comment_id)
 
     return render_template(
         "edit_comment.html",
@@ -186,27 +195,34 @@ def edit_comment(comment_id):
 @comments_bp.route("/delete_comment", defaults={"comment_id": None})
 @comments_bp.route("/delete_comment/<comment_id>")
 @login_required
-@user_owns_comment_or_admin
 def delete_comment(comment_id):
     """
     Deletes a specific comment from the database and updates the associated
     post's comment count.
 
-    This function deletes a comment from the database, decreases the comment
-    count of the associated post, flashes a success message to the user, and
-    redirects to the view_comments template to display the updated list of
-    comments.
+    This function deletes a comment from the database, decreasing the comment
+    count of the associated post in the same operation, flashes a success
+    message to the user, and redirects to the view_comments template to
+    display the updated list of comments. Ownership is checked by the delete
+    itself: unless the current user is an Admin, only a comment they wrote
+    is matched.
 
     Args:
         comment_id (str): The ID of the comment to be deleted.
 
     Returns:
         Response: Redirects to the view_comments template to display the
-        updated list of comments.
+        updated list of comments, or to the posts page with an error message
+        if no comment the user may delete was found.
     """
-    post_id = Comment.find_post_id(comment_id)
-    Post.decrease_comment_count(post_id)
-    Comment.delete_comment(comment_id)
+    if not comment_id or not ObjectId.is_valid(comment_id):
+        flash("Comment Not Specified", "error")
+        return redirect(url_for('posts.get_posts'))
+    owner = None if current_user.role == 'Admin' else current_user.username
+    post_id = Comment.delete_comment(comment_id, owner)
+    if post_id is None:
+        flash("Comment Not Found or not yours to delete", "error")
+        return redirect(url_for('posts.get_posts'))
     flash("Comment Deleted")
 
     return redirect(url_for("comments.view_comments", post_id=post_id))
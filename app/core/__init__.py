@@ -4,5 +4,8 @@ Core Module
 
 This module contains the view for the Home page and Core models, which are
 generic database queries to list the Categories, Levels, Providers and Roles.
+It also holds the database housekeeping shared by the other modules, such as
+the index registry, the lookup cache, per-request MongoDB command
+instrumentation, the background mail outbox and the CLI commands.
 
 """
@@ -0,0 +1,248 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from flask import current_app, request, send_from_directory
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# The folders under app/static whose files are fingerprinted. The captures
+# and wireframes folders only hold the README's screenshots.
+ASSET_DIRS = ["css", "js", "favicon"]
+
+# Fingerprinted copies, their compressed siblings and the manifest are
+# written to this folder under app/static by 'flask assets build'.
+DIST_DIR = "dist"
+MANIFEST = "manifest.json"
+
+# File types worth compressing. Images such as PNGs are compressed already.
+COMPRESSIBLE = {".css", ".js", ".ico", ".svg", ".json", ".webmanifest"}
+
+# Encodings of the precompressed siblings, most preferred first, with the
+# suffix of their files.
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+# Fingerprinted URLs never change content, so they can be cached for a year.
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+def fingerprint(path):
+    """
+    Hashes the content of a file.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        str: The first 12 hex digits of the file's SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def compress(path):
+    """
+    Writes gzip and, if the brotli package is installed, brotli compressed
+    siblings of a file, skipping any that would not be smaller.
+
+    Args:
+        path (str): The path of the file.
+
+    Returns:
+        list: The encodings written, e.g. ['br', 'gzip'].
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    compressed = {"gzip": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        compressed["br"] = brotli.compress(data)
+
+    written = []
+    for encoding, suffix in ENCODINGS:
+        body = compressed.get(encoding)
+        if body is not None and len(body) < len(data):
+            with open(path + suffix, "wb") as f:
+                f.write(body)
+            written.append(encoding)
+    return written
+
+
+def build_assets(static_folder):
+    """
+    Fingerprints the static assets for long-lived caching.
+
+    Every file in ASSET_DIRS is copied to the dist folder with a hash of its
+    content added to its name (css/style.css becomes
+    dist/css/style.3f2a9c1b7e4d.css), along with precompressed siblings of
+    text files. A manifest mapping each original filename to its copy, the
+    hash of its source and the available encodings is written last, and is
+    read on start up by init_assets. The dist folder is rebuilt from
+    scratch each time.
+
+    Args:
+        static_folder (str): The path of the app's static folder.
+
+    Returns:
+        dict: The manifest.
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    shutil.rmtree(dist, ignore_errors=True)
+
+    manifest = {}
+    for folder in ASSET_DIRS:
+        for root, _, files in os.walk(os.path.join(static_folder, folder)):
+            for name in sorted(files):
+                source = os.path.join(root, name)
+                filename = os.path.relpath(
+                    source, static_folder).replace(os.sep, "/")
+                stem, ext = os.path.splitext(filename)
+                digest = fingerprint(source)
+                hashed = f"{DIST_DIR}/{stem}.{digest}{ext}"
+                target = os.path.join(static_folder, hashed)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+                encodings = []
+                if ext.lower() in COMPRESSIBLE:
+                    encodings = compress(target)
+                manifest[filename] = {
+                    "file": hashed,
+                    "source": digest,
+                    "encodings": encodings,
+                }
+
+    with open(os.path.join(dist, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_folder):
+    """
+    Reads the manifest written by build_assets, keeping only the entries
+    whose source file is unchanged since the build.
+
+    Sources are hashed again on start up, so editing a file without running
+    'flask assets build' serves the edited file rather than a stale copy.
+
+    Args:
+        static_folder (str): The path of the app's static folder.
+
+    Returns:
+        dict: The current entries of the manifest, or an empty dict if the
+        assets have not been built.
+
+    Raises:
+        Exception: If there is an issue reading the manifest or a source
+        file, the exception is caught and an error message is printed.
+    """
+    path = os.path.join(static_folder, DIST_DIR, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+        current = {}
+        for filename, entry in manifest.items():
+            source = os.path.join(static_folder, filename)
+            if (os.path.exists(source) and
+                    entry.get("source") == fingerprint(source)):
+                current[filename] = entry
+            else:
+                print(f"Ignoring stale fingerprinted copy of {filename}; "
+                      f"run 'flask assets build'")
+        return current
+    except Exception as e:
+        print(f"Error in load_manifest method: {e}")
+        return {}
+
+
+def accepted_encoding(encodings):
+    """
+    Picks the precompressed sibling to send for the current request.
+
+    Args:
+        encodings (list): The encodings available for the file.
+
+    Returns:
+        tuple: The encoding and file suffix to use, or (None, '') to send
+        the file uncompressed.
+    """
+    for encoding, suffix in ENCODINGS:
+        if encoding in encodings and request.accept_encodings[encoding]:
+            return encoding, suffix
+    return None, ""
+
+
+def send_static(filename):
+    """
+    Serves a static file, replacing Flask's static view.
+
+    Fingerprinted files are served with a one year immutable Cache-Control
+    and, when the browser accepts it, as their precompressed sibling. Other
+    files are served by Flask as before.
+
+    Args:
+        filename (str): The requested path under the static folder.
+
+    Returns:
+        Response: The file.
+    """
+    app = current_app
+    entry = app.config["STATIC_ASSETS"].get("hashed", {}).get(filename)
+    if entry is None:
+        return app.send_static_file(filename)
+
+    encoding, suffix = accepted_encoding(entry["encodings"])
+    mimetype = mimetypes.guess_type(filename)[0] or \
+        "application/octet-stream"
+    response = send_from_directory(
+        app.static_folder, filename + suffix, mimetype=mimetype,
+        max_age=IMMUTABLE_MAX_AGE
+        )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if entry["encodings"]:
+        response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """
+    Points url_for('static', ...) at the fingerprinted copy of each asset
+    and serves those copies with long-lived caching.
+
+    Does nothing until 'flask assets build' has been run, or when
+    STATIC_FINGERPRINTS is disabled, so static files are then served as
+    usual.
+
+    Args:
+        app (Flask): The application.
+    """
+    manifest = {}
+    if app.config["STATIC_FINGERPRINTS"]:
+        manifest = load_manifest(app.static_folder)
+    app.config["STATIC_ASSETS"] = {
+        "files": {name: entry["file"] for name, entry in manifest.items()},
+        "hashed": {entry["file"]: entry for entry in manifest.values()},
+    }
+    if not manifest:
+        return
+
+    @app.url_defaults
+    def fingerprinted_static_url(endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            hashed = app.config["STATIC_ASSETS"]["files"].get(
+                values["filename"])
+            if hashed:
+                values["filename"] = hashed
+
+    app.view_functions["static"] = send_static
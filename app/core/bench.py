@@ -0,0 +1,250 @@
+import gzip
+import re
+import subprocess
+import time
+from datetime import datetime
+import pytz
+from flask import current_app
+from app import mongo
+
+SERVER_TIMING = re.compile(r'db;dur=([\d.]+);desc="(\d+) commands"')
+
+
+def percentile(samples, percent):
+    """
+    Returns the nearest-rank percentile of a list of samples.
+
+    Args:
+        samples (list): The measured values.
+        percent (float): The percentile to return, between 0 and 100.
+
+    Returns:
+        float: The percentile, or None if there are no samples.
+    """
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, int(round(percent / 100 * len(ordered) + 0.5)) - 1)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def build_scenarios(username, writes):
+    """
+    Builds the list of requests to benchmark from the data in the database.
+
+    Sample documents are picked so the heavy cases are exercised: the post
+    with the most comments, the user with the most posts and a comment on
+    that post.
+
+    Args:
+        username (str): The user the logged in scenarios run as. They should
+        be an Admin so every page is reachable.
+        writes (bool): Whether to include scenarios that write to the
+        database.
+
+    Returns:
+        list: A list of dicts with 'name', 'method', 'url', 'data' and
+        'login' keys.
+    """
+    hot_post = mongo.db.posts.find_one(sort=[("comment_count", -1)]) or {}
+    post_id = str(hot_post.get("_id", ""))
+    comment = mongo.db.comments.find_one({"post_id": hot_post.get("_id")})
+    comment_id = str(comment["_id"]) if comment else ""
+    top_poster = next(mongo.db.posts.aggregate([
+        {"$group": {"_id": "$username", "posts": {"$sum": 1}}},
+        {"$sort": {"posts": -1}},
+        {"$limit": 1}
+    ]), {"_id": username})["_id"]
+
+    scenarios = [
+        ("core.home (anonymous)", "GET", "/home", None, False),
+        ("posts.get_posts (anonymous)", "GET", "/get_posts", None, False),
+        ("posts.get_posts", "GET", "/get_posts", None, True),
+        ("comments.view_comments", "GET", f"/view_comments/{post_id}", None,
+         True),
+        ("auth.view_users", "GET", "/view_users", None, True),
+        ("groups.get_groups", "GET", "/get_groups", None, True),
+        ("auth.profile", "GET", f"/profile/{top_poster}", None, True),
+        ("posts.make_post", "GET", "/make_post", None, True),
+        ("posts.edit_post", "GET", f"/edit_post/{post_id}", None, True),
+        ("comments.edit_comment", "GET", f"/edit_comment/{comment_id}", None,
+         True),
+    ]
+    if writes:
+        scenarios.append(
+            ("comments.comment", "POST", f"/comment/{post_id}",
+             {"text": "Benchmark comment"}, True)
+            )
+    return [
+        {"name": name, "method": method, "url": url, "data": data,
+         "login": login}
+        for name, method, url, data, login in scenarios
+    ]
+
+
+def run_scenario(scenario, username, iterations, warmup):
+    """
+    Times repeated requests to one scenario through the Flask test client.
+
+    Args:
+        scenario (dict): A scenario from build_scenarios.
+        username (str): The user logged in scenarios run as.
+        iterations (int): The number of measured requests.
+        warmup (int): The number of unmeasured requests made first.
+
+    Returns:
+        dict: Latency percentiles in milliseconds, the status code, the
+        response size in bytes, uncompressed and as sent to a browser that
+        accepts gzip, and the MongoDB commands per request (read from the
+        Server-Timing header).
+    """
+    app = current_app._get_current_object()
+    client = app.test_client()
+    if scenario["login"]:
+        with client.session_transaction() as session:
+            session["_user_id"] = username
+            session["_fresh"] = True
+
+    latencies = []
+    commands = []
+    db_time = []
+    response = None
+    for i in range(warmup + iterations):
+        # Each request gets its own application context, as it would in
+        # production, rather than sharing the CLI's context (and flask.g).
+        with app.app_context():
+            started = time.perf_counter()
+            response = client.open(
+                scenario["url"],
+                method=scenario["method"],
+                data=scenario["data"],
+                headers={"Accept-Encoding": "gzip"}
+                )
+            elapsed = (time.perf_counter() - started) * 1000
+        wire = response.get_data()
+        body = wire
+        if response.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(wire)
+        if i < warmup:
+            continue
+        latencies.append(elapsed)
+        timing = SERVER_TIMING.search(
+            response.headers.get("Server-Timing", ""))
+        if timing:
+            db_time.append(float(timing.group(1)))
+            commands.append(int(timing.group(2)))
+
+    return {
+        "url": scenario["url"],
+        "method": scenario["method"],
+        "status": response.status_code,
+        "iterations": iterations,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": sum(latencies) / len(latencies),
+        "db_p50_ms": percentile(db_time, 50),
+        "queries": max(commands) if commands else None,
+        "bytes": len(body),
+        "wire_bytes": len(wire),
+    }
+
+
+def run_benchmark(username, iterations, warmup, writes):
+    """
+    Runs every scenario and collects the results with enough metadata to
+    compare runs between commits.
+
+    Args:
+        username (str): The user logged in scenarios run as.
+        iterations (int): The number of measured requests per scenario.
+        warmup (int): The number of unmeasured requests per scenario.
+        writes (bool): Whether to include scenarios that write.
+
+    Returns:
+        dict: A dict with 'meta' (commit, time, dataset size) and 'routes'
+        (results keyed by scenario name).
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+            ).stdout.strip()
+    except Exception:
+        commit = None
+
+    results = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(pytz.utc).isoformat(),
+            "iterations": iterations,
+            "warmup": warmup,
+            "dataset": {
+                name: mongo.db[name].estimated_document_count()
+                for name in ["users", "groups", "posts", "comments"]
+            },
+        },
+        "routes": {},
+    }
+    for scenario in build_scenarios(username, writes):
+        results["routes"][scenario["name"]] = run_scenario(
+            scenario, username, iterations, warmup
+            )
+    return results
+
+
+def check_page_weights(results, budgets):
+    """
+    Compares the size of each benchmarked page with its budget.
+
+    Args:
+        results (dict): The results of run_benchmark.
+        budgets (dict): Maximum uncompressed page sizes in bytes, keyed by
+        endpoint, e.g. the PAGE_WEIGHT_BUDGETS config.
+
+    Returns:
+        list: A message for each page over its budget.
+    """
+    over = []
+    for name, result in results["routes"].items():
+        budget = budgets.get(name.split(" ")[0])
+        if budget is not None and result["bytes"] > budget:
+            over.append(
+                f"{name} is {result['bytes']} bytes, over its page weight "
+                f"budget of {budget}"
+                )
+    return over
+
+
+def format_results(results, baseline=None):
+    """
+    Formats benchmark results as a table, with the change from a baseline
+    run where both contain the same scenario.
+
+    Args:
+        results (dict): The results of run_benchmark.
+        baseline (dict, optional): Earlier results of run_benchmark.
+
+    Returns:
+        str: The formatted table.
+    """
+    columns = ["p50_ms", "p95_ms", "p99_ms", "queries", "bytes",
+               "wire_bytes"]
+    lines = [
+        f"{'route':<32}{'status':>7}" + "".join(f"{c:>16}" for c in columns)
+    ]
+    for name, result in results["routes"].items():
+        previous = (baseline or {}).get("routes", {}).get(name, {})
+        cells = []
+        for column in columns:
+            value = result.get(column)
+            if value is None:
+                cells.append(f"{'n/a':>16}")
+                continue
+            cell = f"{value:.1f}" if isinstance(value, float) else str(value)
+            old = previous.get(column)
+            if old:
+                cell += f" ({(value - old) / old * 100:+.0f}%)"
+            cells.append(f"{cell:>16}")
+        lines.append(f"{name:<32}{result['status']:>7}" + "".join(cells))
+    return "\n".join(lines)
@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    A small thread-safe, process-local cache whose entries expire after a
+    time-to-live and, if a maximum size is given, are evicted least recently
+    used first.
+
+    Hits and misses are counted so the effectiveness of each cache can be
+    inspected via stats().
+    """
+
+    def __init__(self, ttl=60, maxsize=None):
+        """
+        Initializes an empty cache.
+
+        Args:
+            ttl (float): The default number of seconds an entry stays valid.
+            maxsize (int, optional): The maximum number of entries kept. If
+            None, the cache is unbounded.
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for a key, or default if the key is absent
+        or its entry has expired.
+
+        Args:
+            key (hashable): The cache key.
+            default (any, optional): The value returned on a miss.
+
+        Returns:
+            any: The cached value or default.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """
+        Stores a value, evicting the least recently used entry if the cache
+        is full.
+
+        Args:
+            key (hashable): The cache key.
+            value (any): The value to store.
+            ttl (float, optional): Seconds the entry stays valid. Defaults to
+            the cache's ttl.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+
+    def pop(self, key):
+        """
+        Removes a key from the cache if present.
+
+        Args:
+            key (hashable): The cache key.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry from the cache. The counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """
+        Returns the hit/miss counters and current size of the cache.
+
+        Returns:
+            dict: A dict with 'hits', 'misses' and 'size' keys.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+            }
@@ -0,0 +1,290 @@
+import json
+import time
+import click
+import pytz
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from pymongo.errors import BulkWriteError
+from app import mongo
+from app.core.models import Core
+from app.auth.models import User
+from app.posts.models import Post
+from app.core.outbox import Outbox
+from app.core.jobs import Jobs
+from app.core.assets import build_assets
+from app.core.compression import compression_stats
+from app.core.seed import SEED_ANCHOR, SEED_PASSWORD, seed_database
+from app.core.bench import check_page_weights, format_results, \
+    run_benchmark
+from app.core.indexes import ensure_indexes, index_report, print_index_report
+
+db_cli = AppGroup("db", help="Database maintenance commands.")
+outbox_cli = AppGroup("outbox", help="Outgoing email commands.")
+jobs_cli = AppGroup("jobs", help="Background job commands.")
+assets_cli = AppGroup("assets", help="Static asset commands.")
+
+
+@db_cli.command("ensure-indexes")
+def ensure_indexes_command():
+    """
+    Creates the indexes declared by the models and reports any differences.
+
+    Usage: flask db ensure-indexes
+    """
+    ensure_indexes()
+    print_index_report(index_report())
+
+
+@db_cli.command("index-report")
+def index_report_command():
+    """
+    Reports declared indexes that are missing and undeclared indexes that
+    exist, without changing anything.
+
+    Usage: flask db index-report
+    """
+    print_index_report(index_report())
+
+
+@db_cli.command("invalidate-lookups")
+def invalidate_lookups_command():
+    """
+    Makes every worker reload the categories, levels, providers and roles
+    tables. Run this after editing them directly in the database.
+
+    Usage: flask db invalidate-lookups
+    """
+    Core.invalidate_lookups()
+    print("Lookup tables invalidated")
+
+
+@db_cli.command("normalize-users")
+def normalize_users_command():
+    """
+    Fills in the lowercase location field used by the user directory for
+    accounts created before it existed.
+
+    Usage: flask db normalize-users
+    """
+    print(f"Updated {User.normalize_locations()} users")
+
+
+@db_cli.command("normalize-posts")
+def normalize_posts_command():
+    """
+    Converts the group IDs of posts written when they were stored as
+    strings to ObjectIds, so group filters and group deletion find them.
+
+    Usage: flask db normalize-posts
+    """
+    print(f"Updated {Post.normalize_group_ids()} posts")
+
+
+@outbox_cli.command("drain")
+def drain_outbox_command():
+    """
+    Sends every email in the outbox that is due, then exits.
+
+    Usage: flask outbox drain
+    """
+    sent = 0
+    while True:
+        count = Outbox.drain()
+        if not count:
+            break
+        sent += count
+    print(f"Sent {sent} emails")
+
+
+@outbox_cli.command("worker")
+def outbox_worker_command():
+    """
+    Sends emails from the outbox as they become due until interrupted. Use
+    this as a separate process with MAIL_OUTBOX_WORKER=false on the web
+    processes.
+
+    Usage: flask outbox worker
+    """
+    interval = current_app.config["MAIL_OUTBOX_POLL_INTERVAL"]
+    while True:
+        if not Outbox.drain():
+            time.sleep(interval)
+
+
+@jobs_cli.command("run")
+def run_jobs_command():
+    """
+    Runs every background job that is due to completion, then exits.
+
+    Usage: flask jobs run
+    """
+    batches = 0
+    while Jobs.run_pending():
+        batches += 1
+    print(f"Ran {batches} job batches")
+
+
+@jobs_cli.command("worker")
+def jobs_worker_command():
+    """
+    Runs background jobs as they become due until interrupted. Use this as
+    a separate process with JOBS_WORKER=false on the web processes.
+
+    Usage: flask jobs worker
+    """
+    interval = current_app.config["JOBS_POLL_INTERVAL"]
+    while True:
+        if not Jobs.run_pending():
+            time.sleep(interval)
+
+
+@assets_cli.command("build")
+def build_assets_command():
+    """
+    Writes content hashed copies of the CSS, JavaScript and favicon files,
+    with gzip (and brotli, if installed) siblings, to app/static/dist. Run
+    this on every deploy; the app picks them up when it next starts.
+
+    Usage: flask assets build
+    """
+    manifest = build_assets(current_app.static_folder)
+    compressed = sum(1 for entry in manifest.values() if entry["encodings"])
+    print(f"Fingerprinted {len(manifest)} assets, {compressed} with "
+          f"precompressed copies")
+
+
+@click.command("seed")
+@click.option("--users", default=1000, type=click.IntRange(min=1),
+              help="Number of users.")
+@click.option("--groups", default=100, type=click.IntRange(min=0),
+              help="Number of groups.")
+@click.option("--posts", default=10000, type=click.IntRange(min=0),
+              help="Number of posts.")
+@click.option("--comments", default=100000, type=click.IntRange(min=0),
+              help="Number of comments.")
+@click.option("--seed", default=0, help="Random seed.")
+@click.option("--batch-size", default=1000, type=click.IntRange(min=1),
+              help="Documents per insert_many call.")
+@click.option("--skew", default=1.1, type=click.FloatRange(min=0),
+              help="Zipf exponent of the activity distributions.")
+@click.option("--anchor", type=click.DateTime(formats=["%Y-%m-%d"]),
+              default=SEED_ANCHOR.strftime("%Y-%m-%d"),
+              help="UTC date the generated activity leads up to.")
+@click.option("--drop", is_flag=True,
+              help="Drop the users, groups, posts and comments first.")
+@with_appcontext
+def seed_command(users, groups, posts, comments, seed, batch_size, skew,
+                 anchor, drop):
+    """
+    Fills the database with a deterministic synthetic dataset for load
+    testing.
+
+    Usage: flask seed --users 10000 --posts 100000 --comments 1000000
+    """
+    if drop:
+        click.confirm(
+            f"Drop users, groups, posts and comments in "
+            f"'{mongo.db.name}'?", abort=True
+            )
+        for collection in ["users", "groups", "posts", "comments"]:
+            mongo.db.drop_collection(collection)
+    started = time.monotonic()
+    try:
+        counts = seed_database(
+            users, groups, posts, comments, seed, batch_size, skew,
+            anchor=anchor.replace(tzinfo=pytz.utc)
+            )
+    except BulkWriteError:
+        raise click.ClickException(
+            f"'{mongo.db.name}' already holds seeded documents. Pass --drop "
+            f"to replace them."
+            )
+    for collection, count in counts.items():
+        print(f"Inserted {count} {collection}")
+    print(f"Seeded in {time.monotonic() - started:.1f}s. "
+          f"Every user's password is '{SEED_PASSWORD}'; seed0 is an Admin.")
+
+
+@click.command("recount-comments")
+@click.option("--batch-size", default=1000, type=click.IntRange(min=1),
+              help="Posts per cursor batch and per bulk write.")
+@click.option("--interval", default=0, type=click.FloatRange(min=0),
+              help="Repeat every INTERVAL seconds until interrupted. 0 runs "
+                   "once.")
+@with_appcontext
+def recount_comments_command(batch_size, interval):
+    """
+    Fixes posts whose comment_count no longer matches their comments and
+    reports how many had drifted.
+
+    Usage: flask recount-comments [--interval 3600]
+    """
+    while True:
+        started = time.monotonic()
+        report = Post.reconcile_comment_counts(batch_size)
+        print(f"Checked {report['checked']} posts, fixed {report['drifted']} "
+              f"drifted comment counts in {time.monotonic() - started:.1f}s")
+        if not interval:
+            break
+        time.sleep(interval)
+
+
+@click.command("bench")
+@click.option("--user", "username", default="seed0",
+              help="Admin user the logged in routes run as.")
+@click.option("--iterations", default=50, type=click.IntRange(min=1),
+              help="Measured requests per route.")
+@click.option("--warmup", default=5, type=click.IntRange(min=0),
+              help="Unmeasured requests per route.")
+@click.option("--writes", is_flag=True,
+              help="Also benchmark routes that write (adds comments).")
+@click.option("--output", type=click.Path(dir_okay=False),
+              help="Save the results as JSON to this file.")
+@click.option("--baseline", type=click.File(),
+              help="JSON results of an earlier run to compare against.")
+@click.option("--stand-in", is_flag=True,
+              help="Run against an in-process mongomock database seeded "
+                   "with a small dataset instead of MONGO_URI.")
+@with_appcontext
+def bench_command(username, iterations, warmup, writes, output, baseline,
+                  stand_in):
+    """
+    Benchmarks the main routes through the Flask test client and reports
+    latency percentiles, MongoDB commands and bytes per request. Fails if a
+    page is larger than its budget in the PAGE_WEIGHT_BUDGETS config.
+
+    Run it against a database filled by 'flask seed'.
+
+    Usage: flask bench --output before.json
+    """
+    if stand_in:
+        try:
+            import mongomock
+        except ImportError:
+            raise click.ClickException(
+                "--stand-in needs mongomock: pip3 install mongomock")
+        mongo.cx = mongomock.MongoClient()
+        mongo.db = mongo.cx["bench"]
+        seed_database(users=200, groups=20, posts=2000, comments=20000)
+        print("Using mongomock: MongoDB command counts are not available.")
+
+    results = run_benchmark(username, iterations, warmup, writes)
+    if stand_in:
+        # mongomock bypasses pymongo's command monitoring.
+        for result in results["routes"].values():
+            result["queries"] = None
+    previous = json.load(baseline) if baseline else None
+    print(format_results(results, previous))
+    stats = compression_stats()
+    if stats["bytes_in"]:
+        print(f"gzip saved {stats['saved']} of {stats['bytes_in']} bytes "
+              f"({stats['saved'] / stats['bytes_in']:.0%}) over "
+              f"{stats['responses']} responses")
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {output}")
+    over = check_page_weights(
+        results, current_app.config["PAGE_WEIGHT_BUDGETS"])
+    if over:
+        raise click.ClickException("\n".join(over))
@@ -0,0 +1,117 @@
+import gzip
+import threading
+from flask import request
+
+# Response types worth compressing. Images and fonts are compressed already.
+COMPRESSIBLE = {
+    "text/html", "text/css", "text/plain", "text/javascript",
+    "application/javascript", "application/json", "application/xml",
+    "image/svg+xml",
+}
+
+# Totals since the process started, updated by every compressed response.
+_stats_lock = threading.Lock()
+_stats = {"responses": 0, "bytes_in": 0, "bytes_out": 0}
+
+
+def compression_stats():
+    """
+    Returns the totals of the responses compressed by this process.
+
+    Returns:
+        dict: The number of 'responses' compressed, their size before
+        ('bytes_in') and after ('bytes_out') compression and the bytes
+        'saved'.
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["saved"] = stats["bytes_in"] - stats["bytes_out"]
+    return stats
+
+
+def record(bytes_in, bytes_out):
+    """
+    Adds a compressed response to the totals.
+
+    Args:
+        bytes_in (int): The size of the body before compression.
+        bytes_out (int): The size of the body after compression.
+    """
+    with _stats_lock:
+        _stats["responses"] += 1
+        _stats["bytes_in"] += bytes_in
+        _stats["bytes_out"] += bytes_out
+
+
+def compressible(response, min_size):
+    """
+    Checks whether a response is a candidate for compression, whatever the
+    browser accepts.
+
+    Static files are skipped: fingerprinted assets are served precompressed
+    and files streamed from disk cannot be compressed in memory. So are
+    responses without a body, those already encoded, partial content and
+    responses marked 'no-transform'.
+
+    Args:
+        response (Response): The response.
+        min_size (int): The smallest body worth compressing, in bytes.
+
+    Returns:
+        bool: True if the response may be compressed.
+    """
+    return (request.endpoint != "static" and response.status_code == 200
+            and not response.direct_passthrough
+            and not response.is_streamed
+            and "Content-Encoding" not in response.headers
+            and not response.cache_control.no_transform
+            and response.mimetype in COMPRESSIBLE
+            and (response.content_length or 0) >= min_size)
+
+
+def init_compression(app):
+    """
+    Registers the response hook that gzips dynamic responses for browsers
+    that accept it.
+
+    Responses of a COMPRESSIBLE type and at least COMPRESS_MIN_SIZE bytes
+    are compressed at COMPRESS_LEVEL (1 fastest to 9 smallest; 0 disables
+    compression) and marked 'Vary: Accept-Encoding', so shared caches keep
+    the compressed and uncompressed versions apart. A strong ETag is made
+    weak, as the compressed body is no longer byte for byte the same as the
+    uncompressed one. The bytes saved are added to compression_stats and
+    logged at debug level.
+
+    Register this before any other after_request hook, as Flask runs them
+    in reverse order and the body must not change after it is compressed.
+
+    Args:
+        app (Flask): The application.
+    """
+    @app.after_request
+    def compress_response(response):
+        level = app.config["COMPRESS_LEVEL"]
+        if not level or not compressible(
+                response, app.config["COMPRESS_MIN_SIZE"]):
+            return response
+
+        response.vary.add("Accept-Encoding")
+        if not request.accept_encodings["gzip"]:
+            return response
+
+        body = response.get_data()
+        compressed = gzip.compress(body, compresslevel=level)
+        if len(compressed) >= len(body):
+            return response
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = "gzip"
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+
+        record(len(body), len(compressed))
+        app.logger.debug(
+            "%s %s: gzip %d -> %d bytes", request.method, request.path,
+            len(body), len(compressed)
+            )
+        return response
@@ -0,0 +1,101 @@
+import hashlib
+import time
+from functools import wraps
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from app.core.models import Core
+
+# Pages print relative times ('5 minutes ago') at the precision of
+# filters.coarse_seconds, so validators expire every minute even when no
+# data has changed.
+TIME_BUCKET = 60
+
+
+def time_bucket():
+    """
+    Returns the number of the current TIME_BUCKET period.
+
+    Returns:
+        int: Seconds since the epoch divided by TIME_BUCKET, rounded down.
+    """
+    return int(time.time() // TIME_BUCKET)
+
+
+def page_etag(versions, bucket):
+    """
+    Builds the validator of a page from the data it is rendered from.
+
+    The tag covers the endpoint and full URL (path and query string), the
+    viewer (pages show edit links and groups depending on who is logged in),
+    the version stamps of the collections the page displays and the current
+    time bucket (the relative times on the page change as it ages), so it
+    changes whenever any of them does.
+
+    Args:
+        versions (dict): The version stamps, as returned by
+        Core.get_versions.
+        bucket (int): The time bucket, as returned by time_bucket.
+
+    Returns:
+        str: The entity tag, without quotes.
+    """
+    if current_user.is_authenticated:
+        viewer = f"{current_user.username}:{current_user.role}"
+    else:
+        viewer = ""
+    parts = [request.endpoint, request.full_path, viewer, f"t={bucket}"]
+    parts += [f"{name}={versions[name][0]}" for name in sorted(versions)]
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()
+
+
+def conditional(*names):
+    """
+    Decorator answering conditional GET requests for a page without running
+    the view.
+
+    Before the view runs, the version stamps of the given collections are
+    read in a single query and turned into a weak ETag (see page_etag) that
+    also expires every TIME_BUCKET seconds. If the browser already holds
+    that version (If-None-Match), a 304 Not Modified is returned straight
+    away, skipping the page's queries and rendering. Otherwise the view
+    runs and successful responses carry the ETag and 'Cache-Control:
+    private, no-cache' so the browser revalidates on every visit.
+
+    No Last-Modified date is sent: If-Modified-Since would only compare
+    times, and could answer 304 with a page rendered for another viewer or
+    URL, which the ETag covers.
+
+    Requests with pending flash messages always run the view, as the
+    messages are part of the page.
+
+    Args:
+        *names (str): The version stamps the page depends on, e.g. 'posts'.
+
+    Returns:
+        function: The decorator.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET" or session.get("_flashes"):
+                return f(*args, **kwargs)
+
+            try:
+                versions = Core.get_versions(names)
+            except Exception as e:
+                print(f"Error in conditional decorator: {e}")
+                return f(*args, **kwargs)
+            etag = page_etag(versions, time_bucket())
+            not_modified = request.if_none_match.contains_weak(etag)
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
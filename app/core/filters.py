@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from functools import lru_cache
+import humanize
+import pytz
+from bson.objectid import ObjectId
+from flask import g, has_request_context
+
+
+def request_now():
+    """
+    Returns the current UTC time, fixed for the duration of a request.
+
+    Every relative time on a page is then measured from the same instant,
+    and the clock is read once per request rather than once per document.
+
+    Returns:
+        datetime: The timezone aware current time.
+    """
+    if not has_request_context():
+        return datetime.now(pytz.utc)
+    if "request_now" not in g:
+        g.request_now = datetime.now(pytz.utc)
+    return g.request_now
+
+
+def coarse_seconds(seconds):
+    """
+    Rounds an age in seconds down to the precision humanize displays it at.
+
+    naturaltime shows seconds under a minute, then whole minutes, hours and
+    days, so ages in the same bucket always produce the same text.
+
+    Args:
+        seconds (int): The age in seconds.
+
+    Returns:
+        int: The age rounded down to its display precision.
+    """
+    for unit in (86400, 3600, 60):
+        if seconds >= unit:
+            return seconds // unit * unit
+    return max(seconds, 0)
+
+
+@lru_cache(maxsize=4096)
+def humanize_age(seconds):
+    """
+    Returns the humanized text for a coarse age, e.g. '3 days ago'.
+
+    Ages are bucketed by coarse_seconds before reaching this function, so a
+    small cache covers every post and comment on a page.
+
+    Args:
+        seconds (int): The age in seconds, as returned by coarse_seconds.
+
+    Returns:
+        str: The relative time.
+    """
+    return humanize.naturaltime(timedelta(seconds=seconds))
+
+
+def time_ago(value):
+    """
+    Jinja filter rendering how long ago a document was created.
+
+    Used as {{ post._id|time_ago }}: the creation time is taken from the
+    document's ObjectId, so nothing needs to be added to documents before
+    rendering, and only documents that are actually displayed are processed.
+
+    Args:
+        value (ObjectId or datetime): The document's id or creation time.
+
+    Returns:
+        str: The relative time, e.g. '5 minutes ago', or an empty string if
+        the value cannot be interpreted.
+
+    Raises:
+        Exception: If there is an issue calculating the relative time, the
+        exception is caught and an error message is printed.
+    """
+    try:
+        if isinstance(value, ObjectId):
+            value = value.generation_time
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=pytz.utc)
+        seconds = int((request_now() - value).total_seconds())
+        return humanize_age(coarse_seconds(seconds))
+    except Exception as e:
+        print(f"Error in time_ago filter: {e}")
+        return ""
@@ -0,0 +1,81 @@
+from flask import g, has_request_context
+
+# Returned by recall when nothing is stored for a key, as None is a valid
+# stored value (a lookup that found no document).
+MISSING = object()
+
+
+def _identity_map():
+    """
+    Returns the identity map of the current request, creating it if needed.
+
+    Returns:
+        dict: A mapping of (collection, key) to document, or None outside of
+        a request.
+    """
+    if not has_request_context():
+        return None
+    if "identity_map" not in g:
+        g.identity_map = {}
+    return g.identity_map
+
+
+def recall(collection, key):
+    """
+    Looks up a document already loaded during the current request.
+
+    Model lookups by ID or username consult the identity map first, so a
+    document fetched by a permission decorator and again by the view costs a
+    single round trip. The map lives on flask.g and is discarded at the end
+    of the request; outside of a request nothing is remembered.
+
+    Args:
+        collection (str): The collection the document belongs to.
+        key (str): The key it was looked up by, e.g. its ID as a string.
+
+    Returns:
+        dict: The stored document, None if the lookup found no document, or
+        MISSING if the key has not been looked up in this request.
+    """
+    identity_map = _identity_map()
+    if identity_map is None:
+        return MISSING
+    return identity_map.get((collection, str(key)), MISSING)
+
+
+def remember(collection, key, document):
+    """
+    Stores the result of a lookup for the rest of the current request.
+
+    Args:
+        collection (str): The collection the document belongs to.
+        key (str): The key it was looked up by.
+        document (dict): The document, or None if none was found.
+
+    Returns:
+        dict: The document, for convenience.
+    """
+    identity_map = _identity_map()
+    if identity_map is not None:
+        identity_map[(collection, str(key))] = document
+    return document
+
+
+def forget(collection, key=None):
+    """
+    Drops a document from the identity map after it has been written, so a
+    later lookup in the same request reads the new version.
+
+    Args:
+        collection (str): The collection the document belongs to.
+        key (str, optional): The key to drop. If omitted, every document of
+        the collection is dropped.
+    """
+    identity_map = _identity_map()
+    if not identity_map:
+        return
+    if key is not None:
+        identity_map.pop((collection, str(key)), None)
+    else:
+        for stored in [k for k in identity_map if k[0] == collection]:
+            del identity_map[stored]
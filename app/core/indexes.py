@@ -0,0 +1,134 @@
+import threading
+from pymongo.errors import ConnectionFailure
+from app import mongo
+
+
+def get_index_registry():
+    """
+    Collects the indexes declared next to each model.
+
+    Each model class lists the indexes its queries rely on in an INDEXES
+    attribute. The models are imported here rather than at module level to
+    avoid circular imports, as the models themselves import from the app
+    package.
+
+    Returns:
+        dict: A mapping of collection name to a list of pymongo IndexModel
+        instances.
+    """
+    from app.auth.models import User
+    from app.posts.models import Post
+    from app.comments.models import Comment
+    from app.groups.models import Group
+    from app.core.outbox import Outbox
+    from app.core.jobs import Jobs
+
+    return {
+        "users": User.INDEXES,
+        "posts": Post.INDEXES,
+        "comments": Comment.INDEXES,
+        "groups": Group.INDEXES,
+        "outbox": Outbox.INDEXES,
+        "jobs": Jobs.INDEXES,
+    }
+
+
+def ensure_indexes():
+    """
+    Creates any declared index that does not yet exist.
+
+    MongoDB treats creating an index that already exists with the same
+    specification as a no-op, so this is safe to run on every start up.
+    Each collection is handled separately so that a failure on one (e.g. a
+    unique index that cannot be built because of duplicate documents) does
+    not prevent the others from being created. A connection error stops the
+    run, as every other collection would wait for the same timeout.
+
+    Returns:
+        dict: A mapping of collection name to the list of index names
+        created or confirmed, or to the error message if creation failed.
+        Collections after a connection error are left out.
+
+    Raises:
+        Exception: If there is an issue creating the indexes for a
+        collection, the exception is caught and an error message is printed.
+    """
+    results = {}
+    for collection, indexes in get_index_registry().items():
+        try:
+            results[collection] = mongo.db[collection].create_indexes(indexes)
+        except ConnectionFailure as e:
+            print(f"Error in ensure_indexes method ({collection}): {e}")
+            results[collection] = str(e)
+            break
+        except Exception as e:
+            print(f"Error in ensure_indexes method ({collection}): {e}")
+            results[collection] = str(e)
+    return results
+
+
+def bootstrap_indexes(app):
+    """
+    Creates missing indexes and prints the index report in a background
+    thread, so neither start up nor requests wait on the database.
+
+    The report is skipped if a connection error cut index creation short.
+
+    Args:
+        app (Flask): The application.
+
+    Returns:
+        threading.Thread: The started thread.
+    """
+    def run():
+        with app.app_context():
+            results = ensure_indexes()
+            if len(results) == len(get_index_registry()):
+                print_index_report(index_report())
+
+    thread = threading.Thread(target=run, name="index_bootstrap", daemon=True)
+    thread.start()
+    return thread
+
+
+def index_report():
+    """
+    Compares the declared indexes with those present in the database.
+
+    The default '_id_' index is ignored as MongoDB always creates it.
+
+    Returns:
+        dict: A mapping of collection name to a dict with 'missing' (declared
+        but absent) and 'extra' (present but not declared) lists of index
+        names. If an exception occurs, returns the report built so far.
+
+    Raises:
+        Exception: If there is an issue with listing the indexes, the
+        exception is caught and an error message is printed.
+    """
+    report = {}
+    try:
+        for collection, indexes in get_index_registry().items():
+            declared = {index.document["name"] for index in indexes}
+            existing = set(mongo.db[collection].index_information())
+            existing.discard("_id_")
+            report[collection] = {
+                "missing": sorted(declared - existing),
+                "extra": sorted(existing - declared),
+            }
+    except Exception as e:
+        print(f"Error in index_report method: {e}")
+    return report
+
+
+def print_index_report(report):
+    """
+    Prints a summary line per collection of an index report.
+
+    Args:
+        report (dict): The report returned by index_report.
+    """
+    for collection, status in report.items():
+        missing = ", ".join(status["missing"]) or "none"
+        extra = ", ".join(status["extra"]) or "none"
+        print(f"Indexes on {collection}: missing {missing}; extra {extra}")
@@ -0,0 +1,138 @@
+from collections import Counter
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a request issues more MongoDB commands than the budget set
+    for its endpoint in the QUERY_BUDGETS config, and QUERY_BUDGET_STRICT
+    is enabled (the default when testing).
+    """
+
+
+class CommandTally(monitoring.CommandListener):
+    """
+    A pymongo command listener that tallies the commands issued while
+    handling the current Flask request.
+
+    pymongo calls command listeners on the thread that issued the command,
+    so the tally can be kept on flask.g. Commands issued outside a request
+    (CLI commands, background workers) are ignored.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        stats = query_stats()
+        if stats is not None:
+            stats["commands"] += 1
+            stats["duration_ms"] += event.duration_micros / 1000
+            stats["documents"] += count_documents(event.reply)
+            stats["by_command"][event.command_name] += 1
+
+    def failed(self, event):
+        stats = query_stats()
+        if stats is not None:
+            stats["commands"] += 1
+            stats["failures"] += 1
+            stats["duration_ms"] += event.duration_micros / 1000
+            stats["by_command"][event.command_name] += 1
+
+
+def count_documents(reply):
+    """
+    Counts the documents returned to the client in a command reply.
+
+    Args:
+        reply (dict): The reply document of a successful command.
+
+    Returns:
+        int: The number of documents in the reply's cursor batch, 1 for a
+        findAndModify that returned a document, otherwise 0.
+    """
+    cursor = reply.get("cursor")
+    if cursor:
+        batch = cursor.get("firstBatch", cursor.get("nextBatch", []))
+        return len(batch)
+    if reply.get("value") is not None:
+        return 1
+    return 0
+
+
+def query_stats():
+    """
+    Returns the command tally of the current request.
+
+    Returns:
+        dict: A dict with 'commands', 'failures', 'documents', 'duration_ms'
+        and 'by_command' (a Counter of command names) keys, or None outside a
+        request.
+    """
+    if not has_request_context():
+        return None
+    return g.get("mongo_stats")
+
+
+def init_instrumentation(app):
+    """
+    Registers the request hooks that reset, report and budget the per-request
+    MongoDB command tally.
+
+    Every response gets a Server-Timing header with the time spent in
+    MongoDB and the number of commands, and a debug log line with the full
+    breakdown. If the endpoint has an entry in the QUERY_BUDGETS config and
+    the request issued more commands than that, a warning is logged, or
+    QueryBudgetExceeded is raised when QUERY_BUDGET_STRICT is enabled, so
+    tests can pin the number of round trips per endpoint.
+
+    Args:
+        app (Flask): The application to instrument.
+    """
+    @app.before_request
+    def reset_query_stats():
+        g.mongo_stats = {
+            "commands": 0,
+            "failures": 0,
+            "documents": 0,
+            "duration_ms": 0.0,
+            "by_command": Counter(),
+        }
+
+    @app.after_request
+    def report_query_stats(response):
+        stats = query_stats()
+        if stats is None:
+            return response
+
+        response.headers.add(
+            "Server-Timing",
+            f'db;dur={stats["duration_ms"]:.1f};'
+            f'desc="{stats["commands"]} commands"'
+            )
+        app.logger.debug(
+            "%s %s: %d commands (%s), %d documents, %.1f ms",
+            request.method,
+            request.path,
+            stats["commands"],
+            ", ".join(f"{name}={count}" for name, count
+                      in stats["by_command"].items()),
+            stats["documents"],
+            stats["duration_ms"]
+            )
+
+        budget = app.config["QUERY_BUDGETS"].get(request.endpoint)
+        if budget is not None and stats["commands"] > budget:
+            message = (
+                f"{request.endpoint} issued {stats['commands']} MongoDB "
+                f"commands, over its budget of {budget}"
+                )
+            strict = app.config["QUERY_BUDGET_STRICT"]
+            if strict is None:
+                strict = app.testing
+            if strict:
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+
+        return response
@@ -0,0 +1,189 @@
+from datetime import datetime, timedelta
+import pytz
+from flask import current_app
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from app import mongo
+from app.core.worker import start_worker
+
+
+def get_job_handlers():
+    """
+    Collects the functions that process each kind of background job.
+
+    A handler takes the job's payload and a batch size, does a bounded
+    amount of work, and returns True once the job is complete or False if
+    it should be called again. The models are imported here rather than at
+    module level to avoid circular imports.
+
+    Returns:
+        dict: A mapping of job kind to handler.
+    """
+    from app.auth.models import User
+    from app.groups.models import Group
+
+    return {
+        "purge_user": lambda payload, batch_size: User.purge_profile(
+            payload["username"], batch_size),
+        "purge_group": lambda payload, batch_size: Group.purge_group(
+            payload["group_id"], batch_size),
+    }
+
+
+class Jobs:
+    # Indexes backing the claim query in Jobs.claim. Applied by
+    # app.core.indexes.
+    INDEXES = [
+        IndexModel(
+            [("status", ASCENDING), ("next_run_at", ASCENDING)],
+            name="status_next_run_at"),
+    ]
+
+    @staticmethod
+    def enqueue(kind, payload):
+        """
+        Stores a job in the jobs collection to be processed in the
+        background.
+
+        Unless JOBS_WORKER is disabled (e.g. because 'flask jobs worker' runs
+        as a separate process), the in-process worker thread is started if
+        needed and woken up.
+
+        Args:
+            kind (str): The kind of job, a key of get_job_handlers.
+            payload (dict): The arguments of the job.
+
+        Returns:
+            bool: True if the job was stored, False otherwise.
+
+        Raises:
+            Exception: If there is an issue with inserting the job, the
+            exception is caught and an error message is printed.
+        """
+        now = datetime.now(pytz.utc)
+        job = {
+            "kind": kind,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_run_at": now
+        }
+        try:
+            mongo.db.jobs.insert_one(job)
+        except Exception as e:
+            print(f"Error in enqueue method: {e}")
+            return False
+
+        app = current_app._get_current_object()
+        if app.config["JOBS_WORKER"]:
+            Jobs.start_worker(app).wake()
+        return True
+
+    @staticmethod
+    def start_worker(app):
+        """
+        Starts the in-process worker thread that runs background jobs,
+        unless it is already running.
+
+        Args:
+            app (Flask): The application.
+
+        Returns:
+            BackgroundWorker: The running worker.
+        """
+        return start_worker(
+            app,
+            "job_worker",
+            Jobs.run_pending,
+            app.config["JOBS_POLL_INTERVAL"]
+            )
+
+    @staticmethod
+    def claim():
+        """
+        Atomically claims the next job that is due.
+
+        Attempts are counted when a job is claimed, so a batch that kills
+        its worker counts too. Jobs left 'running' for longer than
+        JOBS_CLAIM_TIMEOUT seconds (e.g. because a worker died) are claimed
+        again, unless that was their last attempt, in which case they are
+        marked as failed; handlers are written so that repeating a batch is
+        harmless.
+
+        Returns:
+            dict: The claimed job document, or None if nothing is due.
+        """
+        config = current_app.config
+        while True:
+            now = datetime.now(pytz.utc)
+            stale = now - timedelta(seconds=config["JOBS_CLAIM_TIMEOUT"])
+            job = mongo.db.jobs.find_one_and_update(
+                {"$or": [
+                    {"status": "pending", "next_run_at": {"$lte": now}},
+                    {"status": "running", "claimed_at": {"$lte": stale}}
+                ]},
+                {"$set": {"status": "running", "claimed_at": now},
+                 "$inc": {"attempts": 1}},
+                sort=[("next_run_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER
+                )
+            if job is None or job["attempts"] <= config["JOBS_MAX_ATTEMPTS"]:
+                return job
+            mongo.db.jobs.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": "failed",
+                          "attempts": job["attempts"] - 1,
+                          "last_error": "Worker stopped while running"}}
+                )
+
+    @staticmethod
+    def run_pending():
+        """
+        Runs one batch of the next due job.
+
+        A finished job is removed. An unfinished one goes to the back of the
+        queue with its attempts reset, so long purges share the worker with
+        other jobs. A job that raises is retried with an exponential backoff
+        and marked as failed after JOBS_MAX_ATTEMPTS attempts in a row.
+        Updates only apply while the job is still claimed by this run, so a
+        run that outlived JOBS_CLAIM_TIMEOUT cannot overwrite the state set
+        by the worker that reclaimed the job.
+
+        Returns:
+            int: 1 if a batch was run, 0 if no job was due.
+        """
+        config = current_app.config
+        job = Jobs.claim()
+        if job is None:
+            return 0
+
+        now = datetime.now(pytz.utc)
+        claimed = {"_id": job["_id"], "claimed_at": job["claimed_at"]}
+        try:
+            handler = get_job_handlers()[job["kind"]]
+            done = handler(job["payload"], config["JOBS_BATCH_SIZE"])
+        except Exception as e:
+            print(f"Error in run_pending method ({job['kind']}): {e}")
+            attempts = job["attempts"]
+            if attempts >= config["JOBS_MAX_ATTEMPTS"]:
+                update = {"status": "failed"}
+            else:
+                delay = config["JOBS_RETRY_DELAY"] * 2 ** (attempts - 1)
+                update = {
+                    "status": "pending",
+                    "next_run_at": now + timedelta(seconds=delay)
+                }
+            update["attempts"] = attempts
+            update["last_error"] = str(e)
+            mongo.db.jobs.update_one(claimed, {"$set": update})
+            return 1
+
+        if done:
+            mongo.db.jobs.delete_one(claimed)
+        else:
+            mongo.db.jobs.update_one(
+                claimed,
+                {"$set": {"status": "pending", "next_run_at": now,
+                          "attempts": 0}}
+                )
+        return 1
@@ -1,4 +1,33 @@
+import time
+from datetime import datetime
+import pytz
+from flask import current_app
+from pymongo import UpdateOne
 from app import mongo
+from app.core.cache import TTLCache
+
+# Lookup tables are cached per process. Each entry remembers the version
+# stamp it was loaded under, so an edit made through another worker (which
+# bumps the stamp) is picked up within CORE_CACHE_CHECK_INTERVAL seconds.
+LOOKUP_VERSION = "core_lookups"
+_lookup_cache = TTLCache()
+_lookup_stale = 0
+
+# Whether the server accepts multi-document transactions, checked once per
+# process by Core.transactions_supported.
+_transactions_supported = None
+
+# Soft deleted ("tombstoned") users and groups carry a 'deleted_at' field
+# until a background job purges them. The lists of tombstones used to hide
+# their content are cached per process for TOMBSTONE_CACHE_TTL seconds.
+DELETED = {"deleted_at": {"$exists": True}}
+NOT_DELETED = {"deleted_at": {"$exists": False}}
+_tombstone_cache = TTLCache()
+
+# Recently read version stamps, shared by the callers of
+# Core.get_recent_versions and cleared by every local bump.
+_version_snapshot = TTLCache()
+
 
 class Core:
     @staticmethod
@@ -6,8 +35,8 @@ class Core:
         """
         Retrieves the list of categories from the database.
 
-        This method queries the database to retrieve all category documents
-        from the categories collection and returns them as a list.
+        This method returns all category documents from the categories
+        collection, served from the process-local lookup cache when possible.
 
         Returns:
             list: A list of category documents from the categories collection.
@@ -17,12 +46,7 @@ class Core:
             Exception: If there is an issue with the database query, the
             exception is caught and an error message is printed.
         """
-        try:
-            categories = list(mongo.db.categories.find())
-            return categories
-        except Exception as e:
-            print(f"Error in get_categories method: {e}")
-            return []
+        return Core.get_lookup("categories")
 
     @staticmethod
     def get_levels():
@@ -30,9 +54,10 @@ class Core:
         Retrieves a list of levels from the database.
 
         Returns:
-            list: A list of level documents from the levels collection.
+            list: A list of level documents from the levels collection, served
+            from the lookup cache when possible.
         """
-        return list(mongo.db.levels.find())
+        return Core.get_lookup("levels")
 
     @staticmethod
     def get_providers():
@@ -40,19 +65,283 @@ class Core:
         Retrieves a list of providers from the database.
 
         Returns:
-            list: A list of provider documents from the providers collection.
+            list: A list of provider documents from the providers collection,
+            served from the lookup cache when possible.
         """
-        return list(mongo.db.providers.find())
+        return Core.get_lookup("providers")
 
     @staticmethod
     def get_roles():
         """
         Retrieves a list of all roles from the database.
 
-        This static method queries the database for all documents in the
-        'roles' collection and returns them as a list.
+        This static method returns all documents in the 'roles' collection,
+        served from the lookup cache when possible.
 
         Returns:
             list: A list of all roles from the database.
         """
-        return list(mongo.db.roles.find())
+        return Core.get_lookup("roles")
+
+    @staticmethod
+    def get_lookup(collection):
+        """
+        Retrieves every document of a lookup table, using the process-local
+        cache.
+
+        A cached table is served without a database round trip for
+        CORE_CACHE_CHECK_INTERVAL seconds. After that, the shared version
+        stamp is read: if it is unchanged the entry is trusted again,
+        otherwise (or once CORE_CACHE_TTL has passed) the table is reloaded.
+
+        Args:
+            collection (str): The name of the lookup collection.
+
+        Returns:
+            list: A list of the documents in the collection. If an exception
+            occurs, returns the cached table if there is one, otherwise an
+            empty list.
+
+        Raises:
+            Exception: If there is an issue with the database query, the
+            exception is caught and an error message is printed.
+        """
+        global _lookup_stale
+        config = current_app.config
+        now = time.monotonic()
+        entry = None
+        try:
+            entry = _lookup_cache.get(collection)
+            if entry is not None:
+                interval = config["CORE_CACHE_CHECK_INTERVAL"]
+                if now - entry["checked"] < interval:
+                    return entry["docs"]
+                version = Core.get_version(LOOKUP_VERSION)
+                if version == entry["version"]:
+                    entry["checked"] = now
+                    return entry["docs"]
+                _lookup_stale += 1
+            else:
+                version = Core.get_version(LOOKUP_VERSION)
+
+            docs = list(mongo.db[collection].find())
+            _lookup_cache.set(
+                collection,
+                {"docs": docs, "version": version, "checked": now},
+                ttl=config["CORE_CACHE_TTL"]
+                )
+            return docs
+        except Exception as e:
+            print(f"Error in get_lookup method: {e}")
+            if entry is not None:
+                return entry["docs"]
+            return []
+
+    @staticmethod
+    def invalidate_lookups():
+        """
+        Discards the cached lookup tables in every worker process.
+
+        The local cache is cleared immediately and the shared version stamp is
+        bumped, so other processes reload their tables at their next version
+        check. Call this after editing the categories, levels, providers or
+        roles collections.
+        """
+        _lookup_cache.clear()
+        Core.bump_version(LOOKUP_VERSION)
+
+    @staticmethod
+    def lookup_cache_stats():
+        """
+        Returns the lookup cache counters.
+
+        Returns:
+            dict: A dict with 'hits', 'misses', 'size' and 'stale' (entries
+            reloaded because another process bumped the version stamp) keys.
+        """
+        stats = _lookup_cache.stats()
+        stats["stale"] = _lookup_stale
+        return stats
+
+    @staticmethod
+    def get_version(name):
+        """
+        Retrieves a version stamp from the meta collection.
+
+        Version stamps are counters that are bumped whenever the data they
+        describe changes, letting processes detect changes made elsewhere
+        with a single indexed read.
+
+        Args:
+            name (str): The name of the version stamp.
+
+        Returns:
+            int: The current version, or 0 if it has never been bumped.
+        """
+        doc = mongo.db.meta.find_one({"_id": name}, {"version": 1})
+        return doc["version"] if doc else 0
+
+    @staticmethod
+    def get_versions(names):
+        """
+        Retrieves several version stamps from the meta collection in one
+        query.
+
+        Args:
+            names (list): The names of the version stamps.
+
+        Returns:
+            dict: A mapping of each name to a (version, updated_at) tuple.
+            Stamps that have never been bumped are (0, None).
+        """
+        versions = {name: (0, None) for name in names}
+        for doc in mongo.db.meta.find({"_id": {"$in": list(names)}}):
+            versions[doc["_id"]] = (doc["version"], doc.get("updated_at"))
+        return versions
+
+    @staticmethod
+    def get_recent_versions(names, max_age):
+        """
+        Retrieves several version stamps, reusing a reading up to 'max_age'
+        seconds old.
+
+        This lets hot paths check for changes without a query per request.
+        Writes made by this process clear the reading, so they are seen
+        immediately; writes made by other processes are seen within
+        'max_age' seconds.
+
+        Args:
+            names (list): The names of the version stamps.
+            max_age (float): How many seconds a reading may be reused for.
+
+        Returns:
+            dict: A mapping of each name to a (version, updated_at) tuple, as
+            returned by get_versions.
+        """
+        key = tuple(names)
+        versions = _version_snapshot.get(key)
+        if versions is None:
+            versions = Core.get_versions(names)
+            _version_snapshot.set(key, versions, ttl=max_age)
+        return versions
+
+    @staticmethod
+    def bump_version(*names):
+        """
+        Increments one or more version stamps in the meta collection,
+        creating them if necessary, and records when they changed.
+
+        The collections 'posts', 'comments', 'users' and 'groups' each have a
+        stamp, bumped by every write that changes what their pages display;
+        app.core.conditional uses them to answer conditional requests.
+
+        Args:
+            *names (str): The names of the version stamps.
+
+        Raises:
+            Exception: If there is an issue with the database update, the
+            exception is caught and an error message is printed.
+        """
+        now = datetime.now(pytz.utc)
+        try:
+            mongo.db.meta.bulk_write([
+                UpdateOne(
+                    {"_id": name},
+                    {"$inc": {"version": 1}, "$set": {"updated_at": now}},
+                    upsert=True)
+                for name in names
+            ], ordered=False)
+            _version_snapshot.clear()
+        except Exception as e:
+            print(f"Error in bump_version method: {e}")
+
+    @staticmethod
+    def transactions_supported():
+        """
+        Checks whether the database server supports multi-document
+        transactions, i.e. whether it is a replica set member or a sharded
+        cluster rather than a standalone server.
+
+        The answer is cached for the lifetime of the process.
+
+        Returns:
+            bool: True if transactions are supported, False otherwise or if
+            the check fails.
+        """
+        global _transactions_supported
+        if _transactions_supported is None:
+            try:
+                hello = mongo.db.command("hello")
+                _transactions_supported = (
+                    "setName" in hello or hello.get("msg") == "isdbgrid"
+                    )
+            except Exception as e:
+                print(f"Error in transactions_supported method: {e}")
+                _transactions_supported = False
+        return _transactions_supported
+
+    @staticmethod
+    def run_in_transaction(callback):
+        """
+        Runs a group of writes atomically when the server allows it.
+
+        On a replica set or sharded cluster, the callback runs inside a
+        transaction (retried on transient errors) and receives the session to
+        pass to each operation. On a standalone server it simply runs with a
+        session of None, so the same code works in both environments.
+
+        Args:
+            callback (callable): A function taking a session (or None) and
+            performing the writes.
+
+        Returns:
+            any: The value returned by the callback.
+        """
+        if not Core.transactions_supported():
+            return callback(None)
+        with mongo.cx.start_session() as session:
+            return session.with_transaction(callback)
+
+    @staticmethod
+    def get_tombstones(collection, field):
+        """
+        Retrieves a field of every tombstoned document in a collection, e.g.
+        the usernames of deleted users.
+
+        Tombstones only exist between a delete request and the end of its
+        purge job, so the list is short. It is cached for TOMBSTONE_CACHE_TTL
+        seconds, which bounds how long another worker process may keep
+        showing content that was just deleted.
+
+        Args:
+            collection (str): The name of the collection, 'users' or 'groups'.
+            field (str): The field to collect, e.g. 'username' or '_id'.
+
+        Returns:
+            list: The distinct values of the field among tombstoned documents.
+            If an exception occurs, returns an empty list.
+
+        Raises:
+            Exception: If there is an issue with the database query, the
+            exception is caught and an error message is printed.
+        """
+        key = (collection, field)
+        values = _tombstone_cache.get(key)
+        if values is None:
+            try:
+                values = mongo.db[collection].distinct(field, DELETED)
+            except Exception as e:
+                print(f"Error in get_tombstones method: {e}")
+                return []
+            _tombstone_cache.set(
+                key, values, ttl=current_app.config["TOMBSTONE_CACHE_TTL"]
+                )
+        return values
+
+    @staticmethod
+    def invalidate_tombstones():
+        """
+        Discards this process's cached tombstone lists. Called whenever a
+        document is tombstoned or purged.
+        """
+        _tombstone_cache.clear()
@@ -0,0 +1,196 @@
+from datetime import datetime, timedelta
+import pytz
+from flask import current_app
+from flask_mail import Message
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from app import mongo, mail
+from app.core.worker import start_worker
+
+
+class Outbox:
+    # Indexes backing the claim query in Outbox.claim. Applied by
+    # app.core.indexes.
+    INDEXES = [
+        IndexModel(
+            [("status", ASCENDING), ("next_attempt_at", ASCENDING)],
+            name="status_next_attempt_at"),
+    ]
+
+    @staticmethod
+    def enqueue(subject, recipients, body):
+        """
+        Stores an email in the outbox collection to be sent in the background.
+
+        This keeps slow SMTP servers out of the request: the view returns as
+        soon as the message is stored. Unless MAIL_OUTBOX_WORKER is disabled
+        (e.g. because 'flask outbox worker' runs as a separate process), the
+        in-process worker thread is started if needed and woken up.
+
+        Args:
+            subject (str): The subject of the email.
+            recipients (list): The email addresses to send the email to.
+            body (str): The plain text body of the email.
+
+        Returns:
+            bool: True if the message was stored, False otherwise.
+
+        Raises:
+            Exception: If there is an issue with inserting the message, the
+            exception is caught and an error message is printed.
+        """
+        now = datetime.now(pytz.utc)
+        message = {
+            "subject": subject,
+            "recipients": recipients,
+            "body": body,
+            "status": "pending",
+            "attempts": 0,
+            "created_at": now,
+            "next_attempt_at": now
+        }
+        try:
+            mongo.db.outbox.insert_one(message)
+        except Exception as e:
+            print(f"Error in enqueue method: {e}")
+            return False
+
+        app = current_app._get_current_object()
+        if app.config["MAIL_OUTBOX_WORKER"]:
+            Outbox.start_worker(app).wake()
+        return True
+
+    @staticmethod
+    def start_worker(app):
+        """
+        Starts the in-process worker thread that sends queued emails, unless
+        it is already running.
+
+        Args:
+            app (Flask): The application.
+
+        Returns:
+            BackgroundWorker: The running worker.
+        """
+        return start_worker(
+            app,
+            "outbox_worker",
+            Outbox.drain,
+            app.config["MAIL_OUTBOX_POLL_INTERVAL"]
+            )
+
+    @staticmethod
+    def claim():
+        """
+        Atomically claims the next message that is due to be sent.
+
+        The message is marked as 'sending' so that other workers skip it,
+        and its attempts are counted when it is claimed rather than when a
+        send fails. Messages left in 'sending' for longer than
+        MAIL_OUTBOX_CLAIM_TIMEOUT seconds (e.g. because a worker died
+        mid-send) are claimed again, unless that was their last attempt, in
+        which case they are marked as failed.
+
+        Returns:
+            dict: The claimed outbox document, or None if nothing is due.
+        """
+        config = current_app.config
+        while True:
+            now = datetime.now(pytz.utc)
+            stale = now - timedelta(
+                seconds=config["MAIL_OUTBOX_CLAIM_TIMEOUT"]
+                )
+            message = mongo.db.outbox.find_one_and_update(
+                {"$or": [
+                    {"status": "pending", "next_attempt_at": {"$lte": now}},
+                    {"status": "sending", "claimed_at": {"$lte": stale}}
+                ]},
+                {"$set": {"status": "sending", "claimed_at": now},
+                 "$inc": {"attempts": 1}},
+                sort=[("next_attempt_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER
+                )
+            if (message is None or
+                    message["attempts"] <= config["MAIL_OUTBOX_MAX_ATTEMPTS"]):
+                return message
+            mongo.db.outbox.update_one(
+                {"_id": message["_id"]},
+                {"$set": {"status": "failed",
+                          "attempts": message["attempts"] - 1,
+                          "last_error": "Worker stopped while sending"}}
+                )
+
+    @staticmethod
+    def retry_later(message, error):
+        """
+        Puts a message that could not be sent back in the outbox with an
+        exponential backoff, or marks it as failed once it has used up
+        MAIL_OUTBOX_MAX_ATTEMPTS attempts.
+
+        Args:
+            message (dict): The outbox document that failed to send.
+            error (Exception): The error raised while sending.
+        """
+        config = current_app.config
+        attempts = message["attempts"]
+        if attempts >= config["MAIL_OUTBOX_MAX_ATTEMPTS"]:
+            update = {"status": "failed"}
+        else:
+            delay = config["MAIL_OUTBOX_RETRY_DELAY"] * 2 ** (attempts - 1)
+            update = {
+                "status": "pending",
+                "next_attempt_at": datetime.now(pytz.utc) + timedelta(
+                    seconds=delay)
+            }
+        update["attempts"] = attempts
+        update["last_error"] = str(error)
+        try:
+            mongo.db.outbox.update_one(
+                {"_id": message["_id"]}, {"$set": update}
+                )
+        except Exception as e:
+            print(f"Error in retry_later method: {e}")
+
+    @staticmethod
+    def drain():
+        """
+        Sends the messages that are due over a single SMTP connection.
+
+        The connection is only opened once there is something to send and is
+        reused for every message in the run. Sent messages are removed from
+        the outbox. If a send fails, the message is rescheduled and the run
+        ends, so the next run starts with a fresh connection.
+
+        Returns:
+            int: The number of messages sent.
+
+        Raises:
+            Exception: If there is an issue connecting to the SMTP server, the
+            exception is caught, an error message is printed and the claimed
+            message is rescheduled.
+        """
+        message = Outbox.claim()
+        if message is None:
+            return 0
+
+        sent = 0
+        try:
+            with mail.connect() as connection:
+                while message is not None:
+                    try:
+                        connection.send(Message(
+                            message["subject"],
+                            recipients=message["recipients"],
+                            body=message["body"]
+                            ))
+                    except Exception as e:
+                        print(f"Error in drain method: {e}")
+                        Outbox.retry_later(message, e)
+                        return sent
+                    mongo.db.outbox.delete_one({"_id": message["_id"]})
+                    sent += 1
+                    message = Outbox.claim()
+        except Exception as e:
+            print(f"Error in drain method: {e}")
+            if message is not None:
+                Outbox.retry_later(message, e)
+        return sent
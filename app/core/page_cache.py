@@ -0,0 +1,198 @@
+import time
+from functools import wraps
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+from app.core.cache import TTLCache
+from app.core.models import Core, LOOKUP_VERSION
+
+# The version stamps of the data shown on cached pages. Bumping any of them
+# (i.e. writing a post, comment or group, or editing a lookup table)
+# invalidates every cached page.
+PAGE_VERSIONS = ["posts", "comments", "groups", LOOKUP_VERSION]
+
+# Rendered pages for anonymous visitors, keyed by path and query string.
+# Sized by PAGE_CACHE_SIZE in create_app.
+page_cache = TTLCache()
+
+
+def page_generation():
+    """
+    Returns the current versions of the data shown on cached pages.
+
+    The stamps are read at most every PAGE_CACHE_CHECK_INTERVAL seconds per
+    process (immediately after a write made by this process), so serving a
+    cached page normally needs no database round trip at all.
+
+    Returns:
+        tuple: The version numbers of PAGE_VERSIONS.
+    """
+    versions = Core.get_recent_versions(
+        PAGE_VERSIONS, current_app.config["PAGE_CACHE_CHECK_INTERVAL"]
+        )
+    return tuple(versions[name][0] for name in PAGE_VERSIONS)
+
+
+def shareable(response):
+    """
+    Checks whether a response rendered for an anonymous visitor may be
+    shared with other visitors.
+
+    Args:
+        response (Response): The rendered response.
+
+    Returns:
+        bool: True for complete 200 responses that do not change the
+        session (and so will not set a cookie).
+    """
+    return (response.status_code == 200 and not response.direct_passthrough
+            and not session.modified)
+
+
+def store_page(key, response, generation):
+    """
+    Caches a rendered page if it is safe to share between visitors.
+
+    Args:
+        key (str): The cache key, the request's path and query string.
+        response (Response): The rendered response.
+        generation (tuple): The page_generation read before the page was
+        rendered, so a write made while rendering makes the entry stale
+        rather than tagging the old page with the new versions.
+    """
+    if not shareable(response):
+        return
+    config = current_app.config
+    page_cache.set(key, {
+        "body": response.get_data(),
+        "mimetype": response.mimetype,
+        "etag": response.headers.get("ETag"),
+        "generation": generation,
+        "fresh_until": time.monotonic() + config["PAGE_CACHE_TTL"],
+        "refreshing": False,
+    }, ttl=config["PAGE_CACHE_TTL"] + config["PAGE_CACHE_STALE"])
+
+
+def serve_page(entry, state):
+    """
+    Builds a response from a cached page, answering If-None-Match with a
+    304 when the visitor already has it.
+
+    Args:
+        entry (dict): The cache entry.
+        state (str): 'hit' or 'stale', reported in the X-Page-Cache header.
+
+    Returns:
+        Response: The response.
+    """
+    etag = entry["etag"]
+    if etag and request.if_none_match.contains_raw(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(
+            entry["body"], mimetype=entry["mimetype"]
+            )
+    if etag:
+        response.headers["ETag"] = etag
+    response.headers["X-Page-Cache"] = state
+    return response
+
+
+def public_headers(response):
+    """
+    Marks an anonymous response as cacheable by browsers and shared caches
+    such as a reverse proxy.
+
+    'Vary: Cookie' keeps logged in visitors, whose requests carry a session
+    cookie, from being served the anonymous page by a shared cache.
+
+    Args:
+        response (Response): The response to update.
+
+    Returns:
+        Response: The same response.
+    """
+    config = current_app.config
+    response.headers["Cache-Control"] = (
+        f"public, max-age={int(config['PAGE_CACHE_TTL'])}, "
+        f"stale-while-revalidate={int(config['PAGE_CACHE_STALE'])}"
+        )
+    response.vary.add("Cookie")
+    return response
+
+
+def refresh_page(app, view, args, kwargs, key):
+    """
+    Renders a page again in the background of a request that was served its
+    stale copy, and caches the result.
+
+    Called once the stale response has been sent, in a fresh anonymous
+    request context for the same URL.
+
+    Args:
+        app (Flask): The application.
+        view (function): The undecorated view function.
+        args (tuple): The view's positional arguments.
+        kwargs (dict): The view's keyword arguments.
+        key (str): The cache key of the page, its path and query string.
+
+    Raises:
+        Exception: If there is an issue rendering the page, the exception is
+        caught and an error message is printed.
+    """
+    with app.test_request_context(key):
+        try:
+            generation = page_generation()
+            store_page(key, make_response(view(*args, **kwargs)), generation)
+        except Exception as e:
+            print(f"Error in refresh_page method: {e}")
+            entry = page_cache.get(key)
+            if entry is not None:
+                entry["refreshing"] = False
+
+
+def anonymous_cache(view):
+    """
+    Decorator caching the full response of a page for anonymous visitors.
+
+    Pages are cached per path and query string for PAGE_CACHE_TTL seconds.
+    After that, for PAGE_CACHE_STALE more seconds, the stale copy is still
+    served straight away while the page is rendered again once the response
+    has been sent (stale-while-revalidate). Any write to the data the pages
+    show invalidates every cached page. Logged in visitors, visitors with
+    pending flash messages and non-GET requests always get a freshly
+    rendered page.
+
+    Args:
+        view (function): The view function.
+
+    Returns:
+        function: The wrapped view.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        config = current_app.config
+        if (request.method != "GET" or not config["PAGE_CACHE_TTL"] or
+                session.get("_flashes") or current_user.is_authenticated):
+            return view(*args, **kwargs)
+
+        key = request.full_path
+        entry = page_cache.get(key)
+        generation = page_generation()
+        if entry is not None and entry["generation"] == generation:
+            if time.monotonic() < entry["fresh_until"]:
+                return public_headers(serve_page(entry, "hit"))
+            response = serve_page(entry, "stale")
+            if not entry["refreshing"]:
+                entry["refreshing"] = True
+                app = current_app._get_current_object()
+                response.call_on_close(lambda: refresh_page(
+                    app, view, args, kwargs, key))
+            return public_headers(response)
+
+        response = make_response(view(*args, **kwargs))
+        response.headers["X-Page-Cache"] = "miss"
+        if shareable(response):
+            store_page(key, response, generation)
+            public_headers(response)
+        return response
+    return wrapper
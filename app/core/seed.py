@@ -0,0 +1,287 @@
+import random
+import struct
+from array import array
+from datetime import datetime
+from itertools import accumulate
+import pytz
+from bson.objectid import ObjectId
+from werkzeug.security import generate_password_hash
+from app import mongo
+from app.core.models import Core
+
+# Lookup tables are only filled in when empty, so a real database keeps its
+# own values.
+DEFAULT_LOOKUPS = {
+    "categories": ("category_name", [
+        "Grammar", "Vocabulary", "Pronunciation", "Resources", "Events",
+        "Homework", "Chat"
+    ]),
+    "levels": ("level_name", [
+        "Mynediad", "Sylfaen", "Canolradd", "Uwch", "Hyfedredd"
+    ]),
+    "providers": ("provider_name", [
+        "Cardiff University", "Swansea University", "Bangor University",
+        "Aberystwyth University", "Coleg Cambria", "Say Something in Welsh"
+    ]),
+    "roles": ("role_name", ["Student", "Tutor", "Admin"]),
+}
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+LOCATIONS = [
+    "Cardiff", "Swansea", "Newport", "Wrexham", "Bangor", "Aberystwyth",
+    "Carmarthen", "Caernarfon", "London", ""
+]
+WORDS = (
+    "bore da prynhawn noswaith dda diolch croeso cymraeg dysgu siarad "
+    "gwers geiriau treiglad berf enw ansoddair ysgrifennu darllen gwrando "
+    "help cwestiwn ateb heddiw yfory ddoe wythnos nesaf tiwtor dosbarth"
+).split()
+
+# Every seeded user can log in with this password.
+SEED_PASSWORD = "password"
+
+# Generated creation times lie in the days before this instant, so a seed
+# always produces the same ids and documents.
+SEED_ANCHOR = datetime(2024, 6, 1, tzinfo=pytz.utc)
+
+
+def object_id_at(rng, timestamp):
+    """
+    Builds a deterministic ObjectId whose generation time is 'timestamp'.
+
+    The remaining 8 bytes come from the seeded random generator, so ids are
+    reproducible for a given seed while still sorting by creation time like
+    real ones.
+
+    Args:
+        rng (random.Random): The seeded random generator.
+        timestamp (float): The creation time as a Unix timestamp.
+
+    Returns:
+        ObjectId: The generated id.
+    """
+    return ObjectId(struct.pack(">I", int(timestamp)) + rng.randbytes(8))
+
+
+def skewed_weights(rng, count, skew):
+    """
+    Returns cumulative Zipf-like weights over 'count' items in random order.
+
+    The item ranked n gets a weight of 1 / n ** skew, so a handful of items
+    receive most of the picks. Ranks are shuffled so the popular items are
+    spread across the collection rather than being the first ones inserted.
+
+    Args:
+        rng (random.Random): The seeded random generator.
+        count (int): The number of items.
+        skew (float): The Zipf exponent. 0 gives a uniform distribution.
+
+    Returns:
+        list: Cumulative weights suitable for random.choices(cum_weights=).
+    """
+    weights = [1 / (rank + 1) ** skew for rank in range(count)]
+    rng.shuffle(weights)
+    return list(accumulate(weights))
+
+
+def sentence(rng, low, high):
+    """
+    Returns a random string of between 'low' and 'high' words.
+    """
+    return " ".join(rng.choices(WORDS, k=rng.randint(low, high))).capitalize()
+
+
+def insert_batches(collection, documents, batch_size):
+    """
+    Inserts documents with unordered insert_many calls of 'batch_size'.
+
+    Args:
+        collection (Collection): The collection to insert into.
+        documents (iterable): The documents, generated lazily if desired.
+        batch_size (int): The number of documents per insert_many call.
+
+    Returns:
+        int: The number of documents inserted.
+    """
+    inserted = 0
+    batch = []
+    for document in documents:
+        batch.append(document)
+        if len(batch) == batch_size:
+            collection.insert_many(batch, ordered=False)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        inserted += len(batch)
+    return inserted
+
+
+def seed_lookups():
+    """
+    Fills in any empty lookup table with default values.
+
+    Returns:
+        dict: A mapping of lookup collection name to the list of names it
+        holds after seeding.
+    """
+    names = {}
+    for collection, (field, defaults) in DEFAULT_LOOKUPS.items():
+        if mongo.db[collection].count_documents({}, limit=1) == 0:
+            mongo.db[collection].insert_many(
+                [{field: value} for value in defaults]
+                )
+        names[collection] = mongo.db[collection].distinct(field)
+    return names
+
+
+def seed_database(users, groups, posts, comments, seed=0, batch_size=1000,
+                  skew=1.1, tutor_share=0.05, days=365, anchor=SEED_ANCHOR):
+    """
+    Populates the database with synthetic users, groups, posts and comments.
+
+    Documents have the same shape as those written by User.create_new,
+    Group.insert_group, Post.insert_post and Comment.insert_comment, and the
+    posts' comment_count fields match the comments inserted. Activity is
+    skewed the way real traffic is: a few tutors run many groups, some
+    students belong to many groups, a few users write most posts and a few
+    posts attract most comments. Output is deterministic for a given seed
+    and anchor.
+
+    Comments are generated and inserted batch by batch, so datasets with
+    millions of comments only keep one integer per comment in memory.
+
+    Args:
+        users (int): The number of users. The first is an Admin, the next
+        'tutor_share' of them are Tutors and the rest are Students.
+        groups (int): The number of groups.
+        posts (int): The number of posts.
+        comments (int): The number of comments.
+        seed (int): The random seed.
+        batch_size (int): The number of documents per insert_many call.
+        skew (float): The Zipf exponent used for all skewed choices.
+        tutor_share (float): The fraction of users that are Tutors.
+        days (int): Posts are spread over this many days before 'anchor'.
+        anchor (datetime): The timezone aware time the newest documents
+        are created at.
+
+    Returns:
+        dict: The number of documents inserted per collection.
+    """
+    if not posts:
+        comments = 0
+    rng = random.Random(seed)
+    lookups = seed_lookups()
+    now = anchor.timestamp()
+    password = generate_password_hash(SEED_PASSWORD)
+
+    tutors = max(1, int(users * tutor_share))
+    usernames = [f"seed{i}" for i in range(users)]
+    tutor_names = usernames[1:tutors + 1] or usernames[:1]
+    student_names = usernames[tutors + 1:] or usernames[:1]
+
+    def user_documents():
+        for i, username in enumerate(usernames):
+            if i == 0:
+                role = "Admin"
+            elif i <= tutors:
+                role = "Tutor"
+            else:
+                role = "Student"
+            location = rng.choice(LOCATIONS)
+            yield {
+                "email": f"{username}@example.com",
+                "username": username,
+                "password": password,
+                "role": role,
+                "level": rng.choice(lookups["levels"] + [""]),
+                "provider": rng.choice(lookups["providers"] + [""]),
+                "location": location,
+                "location_lower": location.lower(),
+                "bio": sentence(rng, 0, 30)
+            }
+
+    counts = {"users": insert_batches(
+        mongo.db.users, user_documents(), batch_size)}
+
+    tutor_weights = skewed_weights(rng, len(tutor_names), skew)
+    student_weights = skewed_weights(rng, len(student_names), skew)
+    group_ids = []
+
+    def group_documents():
+        for _ in range(groups):
+            group_id = object_id_at(rng, now - rng.uniform(0, days * 86400))
+            group_ids.append(group_id)
+            size = min(len(student_names), rng.randint(3, 25))
+            students = set(rng.choices(
+                student_names, cum_weights=student_weights, k=size
+                ))
+            yield {
+                "_id": group_id,
+                "tutor": rng.choices(
+                    tutor_names, cum_weights=tutor_weights)[0],
+                "provider": rng.choice(lookups["providers"]),
+                "level": rng.choice(lookups["levels"]),
+                "year": str(rng.randint(2020, 2025)),
+                "weekday": rng.choice(WEEKDAYS),
+                "students": sorted(students)
+            }
+
+    counts["groups"] = insert_batches(
+        mongo.db.groups, group_documents(), batch_size)
+
+    # Comment targets are drawn before the posts are written so each post
+    # can be inserted with its final comment_count.
+    post_times = sorted(now - rng.uniform(0, days * 86400)
+                        for _ in range(posts))
+    post_weights = skewed_weights(rng, posts, skew)
+    targets = array("I")
+    comment_counts = [0] * posts
+    for _ in range(0, comments, batch_size):
+        picks = rng.choices(
+            range(posts), cum_weights=post_weights,
+            k=min(batch_size, comments - len(targets))
+            )
+        targets.extend(picks)
+        for index in picks:
+            comment_counts[index] += 1
+
+    user_weights = skewed_weights(rng, users, skew)
+    post_ids = []
+
+    def post_documents():
+        for index, created in enumerate(post_times):
+            post_id = object_id_at(rng, created)
+            post_ids.append(post_id)
+            if group_ids and rng.random() < 0.5:
+                group_id = rng.choice(group_ids)
+            else:
+                group_id = ""
+            yield {
+                "_id": post_id,
+                "username": rng.choices(
+                    usernames, cum_weights=user_weights)[0],
+                "category": rng.choice(lookups["categories"]),
+                "group_id": group_id,
+                "title": sentence(rng, 2, 8),
+                "description": sentence(rng, 5, 60),
+                "comment_count": comment_counts[index]
+            }
+
+    counts["posts"] = insert_batches(
+        mongo.db.posts, post_documents(), batch_size)
+
+    def comment_documents():
+        for index in targets:
+            created = rng.uniform(post_times[index], now)
+            yield {
+                "_id": object_id_at(rng, created),
+                "post_id": post_ids[index],
+                "text": sentence(rng, 1, 40),
+                "username": rng.choices(usernames, cum_weights=user_weights)[0]
+            }
+
+    counts["comments"] = insert_batches(
+        mongo.db.comments, comment_documents(), batch_size)
+    Core.bump_version("users", "groups", "posts", "comments")
+    return counts
@@ -1,13 +1,16 @@
 from flask import Blueprint, render_template
+from app.core.page_cache import anonymous_cache
 
 core_bp = Blueprint('core', __name__, template_folder='../templates')
 
 
 @core_bp.route("/")
 @core_bp.route("/home")
+@anonymous_cache
 def home():
     """
-    Renders the home page template.
+    Renders the home page template. Anonymous visitors are served from the
+    page cache.
 
     Returns:
         Response: The rendered "home.html" template.
@@ -0,0 +1,113 @@
+import threading
+
+_start_lock = threading.Lock()
+
+
+class BackgroundWorker(threading.Thread):
+    """
+    A daemon thread that repeatedly runs a task inside an application
+    context.
+
+    The task is run every 'interval' seconds, or straight away when wake()
+    is called. It is expected to process whatever work is pending and
+    return the number of items it handled; it is called again immediately
+    while that number is non-zero, so a backlog is drained before the worker
+    goes back to sleep.
+    """
+
+    def __init__(self, app, name, task, interval):
+        """
+        Initializes the worker. Call start() to run it.
+
+        Args:
+            app (Flask): The application whose context the task runs in.
+            name (str): The thread name, used in error messages.
+            task (callable): A function taking no arguments and returning the
+            number of items processed.
+            interval (float): Seconds to sleep between runs when idle.
+        """
+        super().__init__(name=name, daemon=True)
+        self.app = app
+        self.task = task
+        self.interval = interval
+        self._wake_event = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self):
+        """
+        Makes the worker run its task without waiting for the interval.
+        """
+        self._wake_event.set()
+
+    def stop(self):
+        """
+        Asks the worker to exit after the current run.
+        """
+        self._stopping.set()
+        self._wake_event.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                try:
+                    while self.task() and not self._stopping.is_set():
+                        pass
+                except Exception as e:
+                    print(f"Error in {self.name} worker: {e}")
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+
+
+def start_worker(app, key, task, interval):
+    """
+    Starts a background worker for an application unless it is already
+    running.
+
+    Workers are kept in app.extensions under the given key so each process
+    runs at most one of each kind.
+
+    Args:
+        app (Flask): The application whose context the task runs in.
+        key (str): The name of the worker, e.g. 'outbox_worker'.
+        task (callable): The task to run, see BackgroundWorker.
+        interval (float): Seconds to sleep between runs when idle.
+
+    Returns:
+        BackgroundWorker: The running worker.
+    """
+    with _start_lock:
+        worker = app.extensions.get(key)
+        if worker is None or not worker.is_alive():
+            worker = BackgroundWorker(app, key, task, interval)
+            app.extensions[key] = worker
+            worker.start()
+        return worker
+
+
+def start_on_first_request(app, *starters):
+    """
+    Starts background workers when the application handles its first
+    request.
+
+    Work left queued by a previous process (e.g. before a deploy or
+    restart) is then resumed without waiting for new work to be queued.
+    Starting on the first request rather than in create_app keeps CLI
+    commands, which also create the app, from starting workers, and starts
+    the threads in the process that serves requests rather than one that
+    forks before serving.
+
+    Args:
+        app (Flask): The application.
+        *starters (callable): Functions taking the app and starting a
+        worker, e.g. Outbox.start_worker.
+    """
+    if not starters:
+        return
+    started = threading.Event()
+
+    @app.before_request
+    def start_background_workers():
+        if not started.is_set():
+            started.set()
+            for starter in starters:
+                starter(app)
@@ -1,9 +1,25 @@
+from datetime import datetime
+import pytz
 from bson.objectid import ObjectId
+from pymongo import ASCENDING, IndexModel
 from app import mongo
+from app.core.identity import MISSING, forget, recall, remember
+from app.core.jobs import Jobs
+from app.core.models import Core, DELETED, NOT_DELETED
 from app.posts.models import Post
 
 
 class Group:
+    # Indexes backing get_groups_by_role. 'students' is an array, so its
+    # index is multikey. The sparse 'deleted_at' index only holds tombstoned
+    # groups. Applied by app.core.indexes.
+    INDEXES = [
+        IndexModel([("tutor", ASCENDING)], name="tutor"),
+        IndexModel([("students", ASCENDING)], name="students"),
+        IndexModel(
+            [("deleted_at", ASCENDING)], name="deleted_at", sparse=True),
+    ]
+
     # Docstrings written by GPT4o and edited by myself.
     @staticmethod
     def get_groups_by_role(role, username):
@@ -19,6 +35,8 @@ class Group:
         - If the role is 'Student', it retrieves groups where the student list
         includes the specified username.
         - For any other roles, it returns an empty list.
+        Deleted groups, and groups whose tutor has been deleted, are left out
+        while they wait to be purged.
 
         Args:
             role (str): The role of the user (e.g., 'Admin', 'Tutor',
@@ -34,12 +52,18 @@ class Group:
             exception is caught and an error message is printed.
         """
         try:
+            query = dict(NOT_DELETED)
+            tutors = Core.get_tombstones("users", "username")
+            if tutors:
+                query["tutor"] = {"$nin": tutors}
             if role == 'Admin':
-                groups = list(mongo.db.groups.find())
+                groups = list(mongo.db.groups.find(query))
             elif role == 'Tutor':
-                groups = list(mongo.db.groups.find({"tutor": username}))
+                query["tutor"] = username
+                groups = list(mongo.db.groups.find(query))
             elif role == 'Student':
-                groups = list(mongo.db.groups.find({"students": username}))
+                query["students"] = username
+                groups = list(mongo.db.groups.find(query))
             else:
                 groups = []
 
@@ -48,13 +72,36 @@ class Group:
         except Exception as e:
             print(f'Error in get_groups_by_role method: {e}')
 
+    @staticmethod
+    def get_membership_map(groups):
+        """
+        Maps each student to the IDs of the given groups they belong to.
+
+        This lets templates check whether a user is in a group with a set
+        lookup rather than scanning every group's students list for every
+        user.
+
+        Args:
+            groups (list): A list of group documents, e.g. as returned by
+            get_groups_by_role.
+
+        Returns:
+            dict: A mapping of username to a set of group ObjectIds.
+        """
+        memberships = {}
+        for group in groups or []:
+            for username in group.get("students", []):
+                memberships.setdefault(username, set()).add(group["_id"])
+        return memberships
+
     @staticmethod
     def get_group_by_id(group_id):
         """
         Retrieves a group from the database by its ID.
 
         This method queries the database to find a group document that matches
-        the provided group ID.
+        the provided group ID, unless the group was already loaded during the
+        current request.
 
         Args:
             group_id (str): The ID of the group to be retrieved.
@@ -67,9 +114,12 @@ class Group:
             Exception: If there is an issue with the database query, the
             exception is caught and an error message is printed.
         """
+        group = recall("groups", group_id)
+        if group is not MISSING:
+            return group
         try:
             group = mongo.db.groups.find_one({"_id": ObjectId(group_id)})
-            return group
+            return remember("groups", group_id, group)
 
         except Exception as e:
             print(f'Error in get_group_by_id method: {e}')
@@ -99,6 +149,8 @@ class Group:
                 {'_id': ObjectId(group_id)},
                 {'$push': {'students': username}}
             )
+            forget("groups", group_id)
+            Core.bump_version("groups")
 
         except Exception as e:
             print(f'Error in add_student_to_group method: {e}')
@@ -126,6 +178,8 @@ class Group:
                 {'_id': ObjectId(group_id)},
                 {'$pull': {'students': username}}
             )
+            forget("groups", group_id)
+            Core.bump_version("groups")
 
         except Exception as e:
             print(f'Error in remove_student method: {e}')
@@ -160,6 +214,7 @@ class Group:
                 "students": []
             }
             mongo.db.groups.insert_one(group)
+            Core.bump_version("groups")
 
         except Exception as e:
             print(f"Error in insert_group method: {e}")
@@ -202,28 +257,64 @@ class Group:
             mongo.db.groups.update_one(
                 {"_id": ObjectId(group_id)}, {"$set": group}
                 )
+            forget("groups", group_id)
+            Core.bump_version("groups")
         except Exception as e:
             print(f"Error in edit_group method: {e}")
 
     @staticmethod
     def delete_group(group_id):
         """
-        Deletes a group from the database.
+        Marks a group as deleted and schedules its removal.
 
-        This method finds a group by its group_id, deletes any associated
-        questions, and then deletes the group itself from the database.
+        The group is tombstoned with a 'deleted_at' field, which hides it and
+        its posts straight away, and a 'purge_group' job is queued to delete
+        the group's posts, their comments and the group itself in the
+        background. The request therefore takes the same time however much
+        the group contains.
 
         Args:
             group_id (str): The unique identifier of the group to be deleted.
 
         Raises:
-            Exception: If there is an issue with deleting the group in the
+            Exception: If there is an issue with updating the group in the
             database, the exception is caught and an error message is printed.
         """
         try:
-            post = mongo.db.posts.find_one({"group_id": ObjectId(group_id)})
-            if post:
-                Post.delete_post(post._id)
-            mongo.db.groups.delete_one({"_id": ObjectId(group_id)})
+            mongo.db.groups.update_one(
+                {"_id": ObjectId(group_id)},
+                {"$set": {"deleted_at": datetime.now(pytz.utc)}}
+                )
+            forget("groups", group_id)
+            Core.invalidate_tombstones()
+            Core.bump_version("groups", "posts")
+            Jobs.enqueue("purge_group", {"group_id": str(group_id)})
         except Exception as e:
             print(f"Error in delete_group method: {e}")
+
+    @staticmethod
+    def purge_group(group_id, batch_size):
+        """
+        Removes one batch of a deleted group's data. Run by the job runner
+        until it returns True.
+
+        Each call deletes up to 'batch_size' of the group's posts, found
+        through the group_id index, with their comments. Once no posts are
+        left, the group document is deleted.
+
+        Args:
+            group_id (str): The ID of the deleted group.
+            batch_size (int): The maximum number of posts deleted per call.
+
+        Returns:
+            bool: True once the group has been removed, False if more batches
+            remain.
+        """
+        query = {"group_id": ObjectId(group_id)}
+        if Core.run_in_transaction(
+                lambda session: Post.delete_batch(query, batch_size, session)):
+            return False
+        mongo.db.groups.delete_one({"_id": ObjectId(group_id), **DELETED})
+        Core.invalidate_tombstones()
+        Core.bump_version("groups")
+        return True
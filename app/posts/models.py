@@ -1,11 +1,27 @@
-from datetime import datetime
-import humanize
-import pytz
+from flask import current_app
 from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, UpdateOne
 from app import mongo
+from app.core.identity import MISSING, forget, recall, remember
+from app.core.models import Core
 
 
 class Post:
+    # Indexes backing the feed filters (newest first), the profile page and
+    # the purges in User.purge_profile and Group.purge_group. Applied by
+    # app.core.indexes.
+    INDEXES = [
+        IndexModel(
+            [("category", ASCENDING), ("_id", DESCENDING)],
+            name="category_id"),
+        IndexModel(
+            [("group_id", ASCENDING), ("_id", DESCENDING)],
+            name="group_id_id"),
+        IndexModel(
+            [("username", ASCENDING), ("_id", DESCENDING)],
+            name="username_id"),
+    ]
+
     # Docstrings written by GPT4o and edited by myself.
     @staticmethod
     def find_by_id(post_id):
@@ -13,7 +29,8 @@ class Post:
         Retrieves a post from the database by its ID.
 
         This method queries the database to find a post document that matches
-        the provided post ID.
+        the provided post ID, unless the post was already loaded during the
+        current request.
 
         Args:
             post_id (str): The ID of the post to be retrieved.
@@ -26,37 +43,49 @@ class Post:
             Exception: If there is an issue with the database query, the
             exception is caught and an error message is printed.
         """
+        post = recall("posts", post_id)
+        if post is not MISSING:
+            return post
         try:
             post = mongo.db.posts.find_one({"_id": ObjectId(post_id)})
-            return post
+            return remember("posts", post_id, post)
         except Exception as e:
             print(f"Error in find_by_id method: {e}")
             return None
 
     @staticmethod
-    def get_list(category, group_id):
+    def get_list(category, group_id, before=None, page_size=None):
         """
-        Retrieves a list of posts from the database filtered by category and/or
+        Retrieves a page of posts from the database filtered by category and/or
         group.
 
         This method queries the database to find posts that match the provided
         category and/or group ID.
         If neither category nor group ID is provided, it retrieves all posts.
-        The posts are sorted in descending order by their ID. For each post, it
-        calculates and adds the time_ago property to enhance readability
-        regarding when the post was created.
+        The posts are sorted in descending order by their ID and returned one
+        page at a time using keyset pagination: passing the ID of the last post
+        of a page as 'before' returns the next (older) page. Each page is a
+        bounded range scan on the category or group index, so its cost does not
+        grow with the size of the collection. Posts by deleted users or in
+        deleted groups are hidden until their purge job removes them.
 
         Args:
             category (str, optional): The category to filter posts by.
             group_id (str, optional): The group ID to filter posts by.
+            before (str, optional): The ID of the last post on the previous
+            page. Only posts older than this are returned. Invalid IDs are
+            ignored.
+            page_size (int, optional): The maximum number of posts to return.
+            Defaults to the POSTS_PAGE_SIZE config value.
 
         Returns:
             tuple:
-                - list: A list of post documents matching the provided filters,
-                each with the time_ago property added.
+                - list: A list of post documents matching the provided filters.
                 - dict: The query dictionary used to retrieve the posts.
-                If an exception occurs, returns an empty list and the query
-                used.
+                - str: The ID to pass as 'before' to fetch the next page, or
+                None if this is the last page.
+                If an exception occurs, returns an empty list, the query used
+                and None.
 
         Raises:
             Exception: If there is an issue with the database query, the
@@ -66,18 +95,70 @@ class Post:
         if category:
             query['category'] = category
         if group_id:
-            query['group_id'] = group_id
+            query['group_id'] = Post.to_group_id(group_id)
+        if page_size is None:
+            page_size = current_app.config['POSTS_PAGE_SIZE']
+        cursor_query = dict(query)
+        if before and ObjectId.is_valid(before):
+            cursor_query['_id'] = {'$lt': ObjectId(before)}
+        hidden = Post.hidden_by_tombstones()
+        if hidden:
+            cursor_query = {'$and': [cursor_query, hidden]}
         try:
-            if query:
-                posts = list(mongo.db.posts.find(query).sort("_id", -1))
-            else:
-                posts = list(mongo.db.posts.find().sort("_id", -1))
-            for post in posts:
-                Post.set_time_ago(post)
-            return posts, query
+            # One extra post is fetched to find out if another page exists.
+            posts = list(
+                mongo.db.posts.find(cursor_query)
+                .sort("_id", -1)
+                .limit(page_size + 1)
+                )
+            next_before = None
+            if len(posts) > page_size:
+                posts = posts[:page_size]
+                next_before = str(posts[-1]['_id'])
+            return posts, query, next_before
         except Exception as e:
             print(f"Error in get_list method: {e}")
-            return []
+            return [], query, None
+
+    @staticmethod
+    def hidden_by_tombstones():
+        """
+        Builds the query condition excluding posts whose author or group has
+        been deleted but not yet purged.
+
+        Returns:
+            dict: The condition, or an empty dict if nothing is tombstoned.
+        """
+        condition = {}
+        usernames = Core.get_tombstones("users", "username")
+        if usernames:
+            condition['username'] = {'$nin': usernames}
+        group_ids = Core.get_tombstones("groups", "_id")
+        if group_ids:
+            condition['group_id'] = {'$nin': group_ids}
+        return condition
+
+    @staticmethod
+    def to_group_id(group_id):
+        """
+        Converts a group ID received from a form or query string to the type
+        stored in posts.
+
+        A post's group_id holds the group's ObjectId, like the _id it refers
+        to, or an empty string for posts addressed to everyone. Keeping one
+        type lets the feed filter and the group cascade use the group_id
+        index.
+
+        Args:
+            group_id (str or ObjectId): The group ID, or an empty value.
+
+        Returns:
+            ObjectId or str: The ObjectId, or the value unchanged if it is not
+            a valid ID (an empty string stays empty).
+        """
+        if group_id and ObjectId.is_valid(group_id):
+            return ObjectId(group_id)
+        return group_id or ""
 
     @staticmethod
     def get_list_by_username(username):
@@ -87,9 +168,7 @@ class Post:
 
         This method queries the database to find all posts that are associated
         with the provided username. The posts are sorted in descending order by
-        their ID to display the most recent posts first. For each post, it
-        calculates and adds the 'time_ago' property to provide context on how
-        long ago the post was created.
+        their ID to display the most recent posts first.
 
         Args:
             username (str): The username to filter posts by. This is typically
@@ -97,8 +176,7 @@ class Post:
 
         Returns:
             list: A list of post documents associated with the provided
-            username, each enhanced with the 'time_ago' property. If an
-            exception occurs, returns an empty list.
+            username. If an exception occurs, returns an empty list.
 
         Raises:
             Exception: If there is an issue with the database query, the
@@ -106,89 +184,13 @@ class Post:
         """
         try:
             posts = list(
-                mongo.db.posts.find({"username": username}).sort("_id, -1")
+                mongo.db.posts.find({"username": username}).sort("_id", -1)
                 )
-            for post in posts:
-                Post.set_time_ago(post)
             return posts
         except Exception as e:
             print(f"Error in get_list_by_username method: {e}")
             return []
 
-    @staticmethod
-    def set_time_ago(post):
-        """
-        Calculates and sets the 'time_ago' property for a post based on its
-        creation time.
-
-        This method calculates the creation time of the post using the
-        generation time of its ID. It then computes the 'time_ago' property
-        using the humanize library to provide a human-readable relative time
-        (e.g., "3 days ago").
-
-        Args:
-            question (dict): The post document for which the 'time_ago'
-            property will be calculated and set.
-
-        Raises:
-            Exception: If there is an issue with calculating the 'time_ago'
-            property, the exception is caught and an error message is printed.
-        """
-        try:
-            generation_time = post['_id'].generation_time
-            creation_time = generation_time.replace(tzinfo=pytz.utc)
-            post['time_ago'] = humanize.naturaltime(
-                datetime.now(pytz.utc) - creation_time
-                )
-        except Exception as e:
-            print(f"Error in set_time_ago method: {e}")
-
-    @staticmethod
-    def increase_comment_count(post_id):
-        """
-        Increases the comment_count property of a post by one.
-
-        This method updates the specified post in the database, incrementing
-        its comment_count property by one.
-
-        Args:
-            post_id (str): The ID of the post whose comment_count is to be
-            increased.
-
-        Raises:
-            Exception: If there is an issue with updating the post in the
-            database, the exception is caught and an error message is printed.
-        """
-        try:
-            mongo.db.posts.update_one(
-                {'_id': ObjectId(post_id)}, {'$inc': {'comment_count': 1}}
-                )
-        except Exception as e:
-            print(f"Error in increase_comment_count method: {e}")
-
-    @staticmethod
-    def decrease_comment_count(post_id):
-        """
-        Decreases the comment_count property of a post by one.
-
-        This method updates the specified post in the database, decrementing
-        its comment_count property by one.
-
-        Args:
-            post_id (str): The ID of the post whose comment_count is to be
-            decreased.
-
-        Raises:
-            Exception: If there is an issue with updating the post in the
-            database, the exception is caught and an error message is printed.
-        """
-        try:
-            mongo.db.posts.update_one(
-                {'_id': ObjectId(post_id)}, {'$inc': {'comment_count': -1}}
-                )
-        except Exception as e:
-            print(f"Error in decrease_comment_count method: {e}")
-
     @staticmethod
     def insert_post(username, category, group_id, title, description):
         """
@@ -201,7 +203,8 @@ class Post:
         Args:
             username (str): The username of the user creating the post.
             category (str): The category of the post.
-            group_id (str): The ID of the group associated with the post.
+            group_id (str): The ID of the group associated with the post, or
+            an empty string. Stored as an ObjectId (see to_group_id).
             title (str): The title of the post.
             description (str): The description of the post.
 
@@ -213,54 +216,31 @@ class Post:
             post = {
                 "username": username,
                 "category": category,
-                "group_id": group_id,
+                "group_id": Post.to_group_id(group_id),
                 "title": title,
                 "description": description,
                 "comment_count": 0
             }
             mongo.db.posts.insert_one(post)
+            Core.bump_version("posts")
         except Exception as e:
             print(f"Error in insert_post method: {e}")
 
     @staticmethod
-    def get_comment_count(post_id):
-        """
-        Retrieves the comment_count associated with a specific post.
-
-        This method queries the database to find the post by its ID and returns
-        its comment_count property.
-
-        Args:
-            post_id (str): The ID of the post whose comment_count is to be
-            retrieved.
-
-        Returns:
-            int: The comment_count of the post. If an exception occurs, returns
-            0.
-
-        Raises:
-            Exception: If there is an issue with retrieving the post from the
-            database, the exception is caught and an error message is printed.
-        """
-        try:
-            count = Post.find_by_id(post_id)["comment_count"]
-            return count
-        except Exception as e:
-            print(f"Error in get_comment_count method: {e}")
-            return 0
-
-    @staticmethod
-    def update_post(post_id, username, category, group_id, title, description):
+    def update_post(post_id, category, group_id, title, description):
         """
         Updates the details of a specific post in the database.
 
-        This method updates the specified post in the database with the
-        provided username, title, and description. The current comment_count is
-        also retrieved and retained during the update.
+        This method sets only the fields edited through the form (category,
+        group, title and description) in a single update. The author and the
+        comment_count are left untouched, so the update needs no prior read
+        and cannot overwrite a comment counted concurrently.
 
         Args:
             post_id (str): The ID of the post to be updated.
-            username (str): The username of the user updating the question.
+            category (str): The updated category of the post.
+            group_id (str): The updated group ID of the post, or an empty
+            string.
             title (str): The updated title of the question.
             description (str): The updated description of the question.
 
@@ -269,18 +249,17 @@ class Post:
             database, the exception is caught and an error message is printed.
         """
         try:
-            current_comment_count = Post.get_comment_count(post_id)
             submit = {
-                "username": username,
                 "category": category,
-                "group_id": group_id,
+                "group_id": Post.to_group_id(group_id),
                 "title": title,
-                "description": description,
-                "comment_count": current_comment_count
+                "description": description
             }
             mongo.db.posts.update_one(
                 {"_id": ObjectId(post_id)}, {"$set": submit}
                 )
+            forget("posts", post_id)
+            Core.bump_version("posts")
         except Exception as e:
             print(f"Error in update_question method: {e}")
 
@@ -303,5 +282,155 @@ class Post:
         try:
             mongo.db.comments.delete_many({"post_id": ObjectId(post_id)})
             mongo.db.posts.delete_one({"_id": ObjectId(post_id)})
+            forget("posts", post_id)
+            forget("comments")
+            Core.bump_version("posts", "comments")
         except Exception as e:
             print(f"Error in delete_post method: {e}")
+
+    @staticmethod
+    def delete_batch(query, batch_size, session=None):
+        """
+        Deletes up to 'batch_size' posts matching a query, with their
+        comments.
+
+        Used by the purge jobs, which call it repeatedly until it returns 0,
+        so each call does a bounded amount of work: one query for the post
+        IDs and one delete_many each for their comments and the posts.
+
+        Args:
+            query (dict): The query selecting the posts, e.g. by username.
+            batch_size (int): The maximum number of posts to delete.
+            session (ClientSession, optional): The session of the enclosing
+            transaction, if any.
+
+        Returns:
+            int: The number of posts deleted.
+        """
+        post_ids = [
+            post["_id"] for post in mongo.db.posts.find(
+                query, {"_id": 1}, session=session
+                ).limit(batch_size)
+        ]
+        if post_ids:
+            mongo.db.comments.delete_many(
+                {"post_id": {"$in": post_ids}}, session=session)
+            mongo.db.posts.delete_many(
+                {"_id": {"$in": post_ids}}, session=session)
+            Core.bump_version("posts", "comments")
+        return len(post_ids)
+
+    @staticmethod
+    def normalize_group_ids(batch_size=1000):
+        """
+        Converts the group_id of posts written when it was stored as a string
+        to an ObjectId.
+
+        Posts are processed in batches with one bulk write per batch, so the
+        whole collection is never loaded into memory.
+
+        Args:
+            batch_size (int): The number of posts updated per bulk write.
+
+        Returns:
+            int: The number of posts updated.
+
+        Raises:
+            Exception: If there is an issue with the database operations, the
+            exception is caught and an error message is printed.
+        """
+        updated = 0
+        try:
+            cursor = mongo.db.posts.find(
+                {"group_id": {"$type": "string", "$ne": ""}}, {"group_id": 1}
+                ).batch_size(batch_size)
+            batch = []
+            for post in cursor:
+                group_id = Post.to_group_id(post["group_id"])
+                if not isinstance(group_id, ObjectId):
+                    continue
+                batch.append(UpdateOne(
+                    {"_id": post["_id"]}, {"$set": {"group_id": group_id}}
+                    ))
+                if len(batch) == batch_size:
+                    updated += mongo.db.posts.bulk_write(
+                        batch, ordered=False).modified_count
+                    batch = []
+            if batch:
+                updated += mongo.db.posts.bulk_write(
+                    batch, ordered=False).modified_count
+            Core.bump_version("posts")
+        except Exception as e:
+            print(f"Error in normalize_group_ids method: {e}")
+        return updated
+
+    @staticmethod
+    def reconcile_comment_counts(batch_size=1000):
+        """
+        Corrects the comment_count of every post whose value has drifted
+        from the number of comments actually stored.
+
+        The comments are counted per post by one aggregation sorted by post
+        ID, which is streamed alongside a cursor over the posts in the same
+        order, so neither collection is ever loaded into memory. Posts whose
+        counts differ are counted again individually, to leave out comments
+        added while the scan ran, then fixed with one bulk write per batch.
+        Each update only applies if the stored count is still the one that
+        was read, so a concurrent comment is never overwritten.
+
+        Args:
+            batch_size (int): The number of posts read per cursor batch and
+            the maximum number of corrections per bulk write.
+
+        Returns:
+            dict: A dict with 'checked' (posts compared) and 'drifted' (posts
+            corrected) keys.
+
+        Raises:
+            Exception: If there is an issue with the database operations, the
+            exception is caught and an error message is printed.
+        """
+        report = {"checked": 0, "drifted": 0}
+
+        def fix(candidates):
+            updates = []
+            for post_id, stored in candidates:
+                actual = mongo.db.comments.count_documents(
+                    {"post_id": post_id})
+                if actual != stored:
+                    updates.append(UpdateOne(
+                        {"_id": post_id, "comment_count": stored},
+                        {"$set": {"comment_count": actual}}
+                        ))
+            if updates:
+                report["drifted"] += mongo.db.posts.bulk_write(
+                    updates, ordered=False).modified_count
+                Core.bump_version("posts")
+
+        try:
+            counts = mongo.db.comments.aggregate([
+                {"$group": {"_id": "$post_id", "count": {"$sum": 1}}},
+                {"$sort": {"_id": 1}}
+            ], allowDiskUse=True, batchSize=batch_size)
+            posts = mongo.db.posts.find(
+                {}, {"comment_count": 1}
+                ).sort("_id", 1).batch_size(batch_size)
+            counted = next(counts, None)
+            candidates = []
+            for post in posts:
+                report["checked"] += 1
+                while counted is not None and counted["_id"] < post["_id"]:
+                    counted = next(counts, None)
+                actual = 0
+                if counted is not None and counted["_id"] == post["_id"]:
+                    actual = counted["count"]
+                if post.get("comment_count") != actual:
+                    candidates.append((post["_id"], post.get("comment_count")))
+                    if len(candidates) == batch_size:
+                        fix(candidates)
+                        candidates = []
+            if candidates:
+                fix(candidates)
+        except Exception as e:
+            print(f"Error in reconcile_comment_counts method: {e}")
+        return report
@@ -1,7 +1,9 @@
 from functools import wraps
 from flask import Blueprint, render_template, request, redirect, url_for, flash
 from flask_login import current_user, login_required
-from app.core.models import Core
+from app.core.conditional import conditional
+from app.core.page_cache import anonymous_cache
+from app.core.models import Core, LOOKUP_VERSION
 from app.posts.models import Post
 from app.groups.models import Group
 
@@ -10,44 +12,49 @@ posts_bp = Blueprint('posts', __name__, template_folder='../templates')
 
 
 # Docstrings written by GPT4o and edited by myself.
-@posts_bp.route("/get_posts", methods=["GET", "POST"])
+@posts_bp.route("/get_posts")
+@anonymous_cache
+@conditional("posts", "groups", LOOKUP_VERSION)
 def get_posts():
     """
-    Displays a list of posts, either all or filtered by specified criteria.
-
-    On a GET request, this function retrieves all available posts along with
-    associated categories and groups that are relevant based on the current
-    user's role and username. It renders the posts template to display these
-    posts.
-
-    On a POST request, it processes form data to filter posts based on selected
-    categories and groups. It then retrieves and renders the posts template
-    with this filtered list of posts.
+    Displays a page of posts, either all or filtered by specified criteria.
+
+    This function retrieves a page of posts along with associated categories
+    and groups that are relevant based on the current user's role and
+    username, and renders the posts template to display them. The filters are
+    read once from the query string, so filtered views can be bookmarked and
+    each request runs a single posts query:
+      - 'category' and 'group' filter the posts.
+      - 'before', set by the "Load more" link, selects the next page.
+    Repeat visits are answered with 304 Not Modified, without querying the
+    posts, until a post, comment, group or lookup table changes. Anonymous
+    visitors are served from the page cache.
 
     Returns:
-        Response: Renders the 'posts.html' template with variables for the list
-        of posts, categories, and groups available to the user, as well as any
-        active query parameters used for filtering.
+        Response: Renders the 'posts.html' template with variables for the
+        page of posts, categories, and groups available to the user, any
+        active query parameters used for filtering and the cursor for the
+        next page.
     """
+    category = request.args.get("category")
+    group_id = request.args.get("group")
+    before = request.args.get("before")
+
     categories = Core.get_categories()
-    posts, query = Post.get_list(None, None)
+    posts, query, next_before = Post.get_list(category, group_id, before)
     if current_user.is_authenticated:
         groups = Group.get_groups_by_role(
             current_user.role, current_user.username)
     else:
         groups = []
 
-    if request.method == "POST":
-        category = request.form.get("category")
-        group_id = request.form.get("group")
-        posts, query = Post.get_list(category, group_id)
-
     return render_template(
         "posts.html",
         posts=posts,
         categories=categories,
         groups=groups,
-        query=query
+        query=query,
+        next_before=next_before
         )
 
 
@@ -158,14 +165,11 @@ def edit_post(post_id):
             a success message.
     """
     if request.method == "POST":
-        username = current_user.username
         category = request.form.get("category")
         group_id = request.form.get("group")
         title = request.form.get("title")
         description = request.form.get("description")
-        Post.update_post(
-            post_id, username, category, group_id, title, description
-            )
+        Post.update_post(post_id, category, group_id, title, description)
         flash("Post Updated")
         return redirect(url_for('posts.get_posts'))
 
@@ -24,3 +24,29 @@ function clearFilters() {
 
   form.submit();
 }
+
+// Pages render a single confirmation modal and a single "Add to Group"
+// modal, filled in from the data attributes of the link that opened them.
+
+const confirmModal = document.getElementById('confirmModal');
+if (confirmModal) {
+  confirmModal.addEventListener('show.bs.modal', event => {
+    const trigger = event.relatedTarget;
+    document.getElementById('confirmModalButton').href = trigger.dataset.confirmUrl;
+  });
+}
+
+const addToGroupModal = document.getElementById('addToGroupModal');
+if (addToGroupModal) {
+  addToGroupModal.addEventListener('show.bs.modal', event => {
+    const trigger = event.relatedTarget;
+    const memberOf = trigger.dataset.memberOf.split(' ');
+    document.getElementById('addToGroupForm').action = trigger.dataset.addUrl;
+
+    addToGroupModal.querySelectorAll('.form-check').forEach(option => {
+      const radio = option.querySelector('input');
+      radio.checked = false;
+      option.hidden = memberOf.includes(radio.value);
+    });
+  });
+}